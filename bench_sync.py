@@ -0,0 +1,477 @@
+# ==============================================================================
+# MAMBA SYNC TOOL - BENCHMARK HARNESS
+#
+# PURPOSE:
+# Measures how sync.py commands scale on throwaway local repositories.
+# Runs fully offline: a bare repo stands in for the remote and a fake
+# "gh" shim on PATH answers for --release / --deploy.
+#
+# For every run it records wall time, process count, peak RSS of the
+# sync.py process and output size into a JSON and a CSV results file.
+# Processes are counted outside sync.py: a "git" wrapper on PATH appends
+# one line per call to a counter file before running the real git, and
+# the gh shim does the same, so every tool version is measured the same
+# way (no --profile). Results from different tool versions (--sync,
+# --label) can be appended to the same files and compared.
+#
+# USAGE:
+# python bench_sync.py                                  → default sizes, zip/update/full-backup
+# python bench_sync.py --files 5000 --dirs 200 --history 300
+# python bench_sync.py --commands zip,update,deploy,release --repeat 5
+# python bench_sync.py --set UpdateMode=objects --label objects
+# python bench_sync.py --sync old/sync.py --label 1.22.2
+# python bench_sync.py --compare                       → table of results file
+# ==============================================================================
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import argparse
+import importlib
+import platform
+import tempfile
+import subprocess
+import configparser
+from datetime import datetime
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ==============================================================================
+# COMMANDS (name -> sync.py arguments)
+# ==============================================================================
+COMMANDS = {
+    "dev":         [],
+    "zip":         ["--zip"],
+    "full-backup": ["--full-backup"],
+    "incremental": ["--full-backup", "--incremental"],
+    "update":      ["--update"],
+    "release":     ["--release"],
+    "deploy":      ["--deploy"],
+}
+
+RESULT_FIELDS = [
+    "timestamp", "label", "tool_version", "command", "run", "files", "dirs",
+    "history", "data_bytes", "wall_s", "forks", "peak_rss_kb", "output_bytes",
+    "rc", "settings", "python", "platform",
+]
+
+WHITELIST = "src/, assets/, .gitignore, CHANGELOG.md, manifest.xml, README.md"
+
+
+def log(msg):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}", flush=True)
+
+
+def git(cwd, *args, input_text=""):
+    res = subprocess.run(["git", *args], cwd=cwd, text=True, capture_output=True,
+                         input=input_text)
+    if res.returncode != 0:
+        sys.exit(f"git {' '.join(args)} failed in {cwd}:\n{res.stderr}")
+    return res.stdout.strip()
+
+
+def core_path(sync_path):
+    """sync_core.py next to a launcher sync.py; older versions are one file."""
+    core = os.path.join(os.path.dirname(os.path.abspath(sync_path)), "sync_core.py")
+    return core if os.path.exists(core) else None
+
+
+def tool_version(sync_path):
+    with open(core_path(sync_path) or sync_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("SCRIPT_VER"):
+                return line.split("=", 1)[1].strip().strip("\"'")
+    return "?"
+
+
+# ==============================================================================
+# SYNTHETIC REPOSITORY
+# ==============================================================================
+def file_payload(rng, size, binary):
+    """Compressible text or incompressible bytes of the requested size."""
+    if binary:
+        return rng.randbytes(size)
+    words = [b"sync", b"plugin", b"value", b"return", b"config", b"branch", b"\n"]
+    out   = bytearray()
+    while len(out) < size:
+        out += rng.choice(words) + b" "
+    return bytes(out[:size])
+
+
+def build_template(root, files, dirs, min_size, max_size, history, seed):
+    """
+    root/remote.git  bare "remote" with dev and master
+    root/proj        dev checkout (origin = ../remote.git)
+    Returns total bytes of generated files.
+    """
+    rng    = random.Random(seed)
+    remote = os.path.join(root, "remote.git")
+    proj   = os.path.join(root, "proj")
+    os.makedirs(proj)
+    git(root, "init", "-q", "--bare", remote)
+    git(proj, "init", "-q", "-b", "dev")
+    git(proj, "config", "user.email", "bench@localhost")
+    git(proj, "config", "user.name", "bench")
+    git(proj, "config", "commit.gpgsign", "false")
+
+    # Tree: half the dirs are public (src/, assets/), half private (tools/)
+    dir_paths = []
+    for i in range(max(dirs, 1)):
+        top = ("src", "assets", "tools", "tools")[i % 4]
+        dir_paths.append(f"{top}/d{i:04d}" + (f"/sub{i % 7}" if i % 3 == 0 else ""))
+
+    paths      = []
+    data_bytes = 0
+    for i in range(files):
+        d      = dir_paths[i % len(dir_paths)]
+        binary = d.startswith("assets")
+        ext    = ".bin" if binary else ".cs"
+        # Log-uniform sizes: many small files, a few large ones
+        size = int(min_size * (max_size / min_size) ** rng.random()) if max_size > min_size else min_size
+        rel  = f"{d}/f{i:06d}{ext}"
+        full = os.path.join(proj, *rel.split("/"))
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "wb") as f:
+            f.write(file_payload(rng, size, binary))
+        paths.append(rel)
+        data_bytes += size
+
+    with open(os.path.join(proj, "manifest.xml"), "w", encoding="utf-8") as f:
+        f.write("<Plugin><Version>1.0.0</Version></Plugin>\n")
+    with open(os.path.join(proj, "README.md"), "w", encoding="utf-8") as f:
+        f.write("# Bench\nVersion: 1.0.0\n")
+    with open(os.path.join(proj, "CHANGELOG.md"), "w", encoding="utf-8") as f:
+        f.write("# Changelog\n")
+    with open(os.path.join(proj, ".gitignore"), "w", encoding="utf-8") as f:
+        f.write("logs/\n*.zip\nconfig_sync.ini\nsync.py\nsync_core.py\n")
+
+    git(proj, "add", "-A")
+    git(proj, "commit", "-q", "-m", "feat: initial import")
+
+    # History: each commit touches a handful of text files
+    text_paths = [p for p in paths if p.endswith(".cs")] or paths
+    for n in range(history):
+        for rel in rng.sample(text_paths, min(3, len(text_paths))):
+            with open(os.path.join(proj, *rel.split("/")), "ab") as f:
+                f.write(f"// change {n}\n".encode())
+        prefix = rng.choice(("feat", "fix", "refac", "docs", "chore"))
+        git(proj, "commit", "-q", "-a", "-m", f"{prefix}: change {n}")
+
+    git(proj, "remote", "add", "origin", "../remote.git")
+    git(proj, "push", "-q", "origin", "dev")
+
+    # Public master: one root commit on the remote, not checked out locally
+    tree   = git(proj, "mktree")
+    commit = git(proj, "commit-tree", tree, "-m", "init")
+    git(proj, "push", "-q", "origin", f"{commit}:refs/heads/master")
+    git(proj, "fetch", "-q", "origin")
+    return data_bytes
+
+
+def install_sync(proj, sync_path, settings):
+    """Copy sync.py (and sync_core.py) in, let it create its default config, apply settings."""
+    shutil.copy2(sync_path, os.path.join(proj, "sync.py"))
+    core = core_path(sync_path)
+    if core:
+        shutil.copy2(core, os.path.join(proj, "sync_core.py"))
+    subprocess.run([sys.executable, "sync.py", "-y"], cwd=proj, capture_output=True)
+    config_file = os.path.join(proj, "config_sync.ini")
+    if not os.path.exists(config_file):
+        sys.exit(f"sync.py did not create {config_file}")
+
+    cfg = configparser.ConfigParser()
+    cfg.read(config_file, encoding="utf-8")
+    cfg["SETTINGS"]["ReleaseWhiteList"] = WHITELIST
+    cfg["SETTINGS"]["ConsoleLogLevel"]  = "ERROR"
+    for key, value in settings.items():
+        cfg["SETTINGS"][key] = value
+    with open(config_file, "w", encoding="utf-8") as f:
+        cfg.write(f)
+
+
+# ==============================================================================
+# PATH SHIMS (fake gh, counting git wrapper)
+#
+# Both append their name to $BENCH_FORK_LOG (when set) once per top-level
+# call; BENCH_SHIM marks processes started by a shim so nested git calls
+# are not counted twice. sync.py starts "gh"/"git" by name: on Windows
+# that only finds .exe files, so there the shims are Python scripts
+# behind the distlib launcher pip uses for console scripts.
+# ==============================================================================
+SH_SHIM = """#!/bin/sh
+if [ -n "$BENCH_FORK_LOG" ] && [ -z "$BENCH_SHIM" ]; then
+    echo {name} >> "$BENCH_FORK_LOG"
+fi
+{action}
+"""
+
+PY_SHIM = """#!python
+import os, subprocess, sys
+REAL = {real!r}
+if os.environ.get("BENCH_FORK_LOG") and not os.environ.get("BENCH_SHIM"):
+    with open(os.environ["BENCH_FORK_LOG"], "a") as f:
+        f.write("{name}\\n")
+if REAL:
+    env = dict(os.environ, BENCH_SHIM="1")
+    sys.exit(subprocess.call([REAL, *sys.argv[1:]], env=env))
+sys.exit(0)
+"""
+
+
+def write_shim(bin_dir, name, real=None):
+    """bin_dir/name: count the call, then exec real (or exit 0 if None)."""
+    if os.name != "nt":
+        action = f'BENCH_SHIM=1 exec "{real}" "$@"' if real else "exit 0"
+        shim   = os.path.join(bin_dir, name)
+        with open(shim, "w", encoding="utf-8") as f:
+            f.write(SH_SHIM.format(name=name, action=action))
+        os.chmod(shim, 0o755)
+        return
+
+    try:
+        scripts = importlib.import_module("pip._vendor.distlib.scripts")
+    except ImportError:
+        sys.exit("Windows shims need pip's distlib launcher (python -m ensurepip).")
+    src_dir = os.path.join(bin_dir, "src")
+    os.makedirs(src_dir, exist_ok=True)
+    with open(os.path.join(src_dir, name + ".py"), "w", encoding="utf-8") as f:
+        f.write(PY_SHIM.format(name=name, real=real))
+    maker = scripts.ScriptMaker(src_dir, bin_dir, add_launchers=True)
+    maker.executable = sys.executable
+    maker.make(name + ".py")      # -> bin_dir/name.exe
+
+
+def install_shims(bin_dir):
+    """Fake GitHub CLI (accepts every call, touches nothing) and git counter."""
+    real_git = shutil.which("git")
+    if not real_git:
+        sys.exit("git not found on PATH")
+    os.makedirs(bin_dir, exist_ok=True)
+    write_shim(bin_dir, "gh")
+    write_shim(bin_dir, "git", os.path.abspath(real_git))
+
+
+def count_forks(fork_log):
+    if not os.path.exists(fork_log):
+        return 0
+    with open(fork_log, "r", encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+# ==============================================================================
+# MEASUREMENT
+# ==============================================================================
+def zip_outputs(run_root):
+    """Every ZIP sync.py can write: project dir (zip/release) and parent (backups)."""
+    found = {}
+    for d in (run_root, os.path.join(run_root, "proj")):
+        for name in os.listdir(d):
+            if name.endswith(".zip"):
+                found[os.path.join(d, name)] = os.path.getsize(os.path.join(d, name))
+    return found
+
+
+def run_measured(cmd, cwd, env):
+    """Run cmd; return (rc, wall seconds, peak RSS in KB or None)."""
+    start = time.perf_counter()
+    proc  = subprocess.Popen(cmd, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is KB on Linux, bytes on macOS
+        peak = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+        return proc.returncode, wall, peak
+    rc = proc.wait()
+    return rc, time.perf_counter() - start, None
+
+
+def bench_command(name, template, work_dir, sync_path, settings, env, run_no):
+    """Fresh copy of the template, one timed sync.py run."""
+    run_root = os.path.join(work_dir, f"{name}-{run_no}")
+    shutil.copytree(template, run_root, symlinks=True)
+    proj = os.path.join(run_root, "proj")
+    install_sync(proj, sync_path, settings)
+
+    fork_log = os.path.join(run_root, "forks.log")
+    before   = zip_outputs(run_root)
+    cmd      = [sys.executable, "sync.py", *COMMANDS[name], "-y"]
+    rc, wall, peak = run_measured(cmd, proj, dict(env, BENCH_FORK_LOG=fork_log))
+    after    = zip_outputs(run_root)
+
+    return {
+        "wall_s":       round(wall, 4),
+        "forks":        count_forks(fork_log),
+        "peak_rss_kb":  peak,
+        "output_bytes": sum(size for path, size in after.items() if path not in before),
+        "rc":           rc,
+    }
+
+
+# ==============================================================================
+# RESULTS
+# ==============================================================================
+def save_results(records, json_path, csv_path):
+    existing = []
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            existing = json.load(f)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(existing + records, f, indent=2)
+
+    new_csv = not os.path.exists(csv_path)
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if new_csv:
+            writer.writeheader()
+        writer.writerows(records)
+
+
+def median(values):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2
+
+
+def print_table(records):
+    """Median per (label, command, size); one row each."""
+    groups = {}
+    for r in records:
+        key = (r["label"], r["command"], r["files"], r["dirs"], r["history"])
+        groups.setdefault(key, []).append(r)
+
+    print(f"{'Label':<14} {'Command':<12} {'Files':>7} {'Dirs':>5} {'Hist':>5} {'Runs':>4} "
+          f"{'Wall s':>8} {'Forks':>6} {'RSS MB':>7} {'Out MB':>8} {'Fail':>4}")
+    print("-" * 88)
+    for (label, command, files, dirs, history), rows in sorted(groups.items()):
+        wall  = median(r["wall_s"] for r in rows)
+        forks = median(r["forks"] for r in rows)
+        rss   = median(r["peak_rss_kb"] for r in rows)
+        out   = median(r["output_bytes"] for r in rows)
+        fails = sum(1 for r in rows if r["rc"] != 0)
+        print(f"{label:<14} {command:<12} {files:>7} {dirs:>5} {history:>5} {len(rows):>4} "
+              f"{wall:>8.3f} {forks if forks is not None else '-':>6} "
+              f"{rss / 1024 if rss is not None else 0:>7.1f} {out / (1024 * 1024):>8.2f} {fails:>4}")
+
+
+# ==============================================================================
+# MAIN
+# ==============================================================================
+def parse_settings(pairs):
+    settings = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            sys.exit(f"--set expects KEY=VALUE, got '{pair}'")
+        settings[key.strip()] = value.strip()
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark sync.py commands on synthetic local repositories (offline)",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument("--sync",     default=os.path.join(SCRIPT_DIR, "sync.py"),
+                        help="sync.py to benchmark (default: next to this script)")
+    parser.add_argument("--label",    help="Result label (default: tool version of --sync)")
+    parser.add_argument("--commands", default="zip,update,full-backup",
+                        help=f"Comma list of: {', '.join(COMMANDS)}")
+    parser.add_argument("--files",    type=int, default=500,  help="Generated files")
+    parser.add_argument("--dirs",     type=int, default=20,   help="Generated directories")
+    parser.add_argument("--min-size", type=int, default=200,  help="Smallest file (bytes)")
+    parser.add_argument("--max-size", type=int, default=256 * 1024, help="Largest file (bytes)")
+    parser.add_argument("--history",  type=int, default=50,   help="Dev commits after import")
+    parser.add_argument("--repeat",   type=int, default=3,    help="Runs per command")
+    parser.add_argument("--seed",     type=int, default=1,    help="Content generator seed")
+    parser.add_argument("--set",      action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a config_sync.ini setting (repeatable)")
+    parser.add_argument("--out",      default=os.path.join(SCRIPT_DIR, "bench_results"),
+                        help="Results path without extension (.json and .csv are appended to)")
+    parser.add_argument("--workdir",  help="Where to build repos (default: temp dir)")
+    parser.add_argument("--keep",     action="store_true", help="Keep generated repos")
+    parser.add_argument("--compare",  action="store_true", help="Only print the results table")
+    args = parser.parse_args()
+
+    json_path = args.out + ".json"
+    csv_path  = args.out + ".csv"
+
+    if args.compare:
+        if not os.path.exists(json_path):
+            sys.exit(f"No results in {json_path}")
+        with open(json_path, "r", encoding="utf-8") as f:
+            print_table(json.load(f))
+        return
+
+    commands = [c.strip() for c in args.commands.split(",") if c.strip()]
+    unknown  = [c for c in commands if c not in COMMANDS]
+    if unknown:
+        sys.exit(f"Unknown command(s): {', '.join(unknown)}")
+
+    sync_path = os.path.abspath(args.sync)
+    version   = tool_version(sync_path)
+    label     = args.label or version
+    settings  = parse_settings(args.set)
+
+    work_dir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="sync-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    template = os.path.join(work_dir, "template")
+
+    env = os.environ.copy()
+    bin_dir = os.path.join(work_dir, "bin")
+    install_shims(bin_dir)
+    env["PATH"] = bin_dir + os.pathsep + env.get("PATH", "")
+    for key in ("GIT_DIR", "GIT_WORK_TREE", "GIT_INDEX_FILE"):
+        env.pop(key, None)
+
+    try:
+        log(f"Building template: {args.files} files, {args.dirs} dirs, {args.history} commits...")
+        start      = time.perf_counter()
+        data_bytes = build_template(template, args.files, args.dirs, args.min_size,
+                                    args.max_size, args.history, args.seed)
+        log(f"Template ready ({data_bytes / (1024 * 1024):.1f} MB) in "
+            f"{time.perf_counter() - start:.1f} s: {template}")
+
+        records = []
+        for name in commands:
+            for run_no in range(1, args.repeat + 1):
+                result = bench_command(name, template, work_dir, sync_path, settings, env,
+                                       run_no)
+                log(f"{name:<12} run {run_no}: {result['wall_s']:.3f} s, "
+                    f"{result['forks']} processes, rc={result['rc']}")
+                records.append({
+                    "timestamp":    datetime.now().isoformat(timespec="seconds"),
+                    "label":        label,
+                    "tool_version": version,
+                    "command":      name,
+                    "run":          run_no,
+                    "files":        args.files,
+                    "dirs":         args.dirs,
+                    "history":      args.history,
+                    "data_bytes":   data_bytes,
+                    "settings":     json.dumps(settings, sort_keys=True),
+                    "python":       platform.python_version(),
+                    "platform":     platform.platform(),
+                    **result,
+                })
+                if not args.keep:
+                    shutil.rmtree(os.path.join(work_dir, f"{name}-{run_no}"), ignore_errors=True)
+
+        save_results(records, json_path, csv_path)
+        log(f"Results appended to {json_path} and {csv_path}")
+        print()
+        print_table(records)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
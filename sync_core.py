@@ -0,0 +1,4142 @@
+# ==============================================================================
+# MAMBA SYNC TOOL
+#
+# PURPOSE:
+# Maintains two separate Git branches with different purposes and histories:
+#
+# DEV BRANCH (private):
+#   - Full development history (100+ commits, tools, docs, experiments)
+#   - Contains everything: build scripts, test files, documentation
+#   - Pushed to private remote (private/dev or origin/dev)
+#
+# MASTER BRANCH (public on GitHub):
+#   - Clean, minimal history (only sync tool commits)
+#   - Contains ONLY whitelisted files (Plugin/, manifest.xml, README, etc.)
+#   - Each update adds +1 commit (linear history, NO dev commits leak)
+#   - Example: commit 1: initial → commit 2: fix → commit 3: feat
+#
+# COMMANDS:
+# python sync.py             → Commit & push dev changes (private)
+# python sync.py --update    → Update public master (+1 commit, whitelisted files)
+# python sync.py --release   → --update + create ZIPs + GitHub Release
+# python sync.py --deploy    → WIPE master history (orphan commit, use for cleanup)
+# python sync.py --reset     → Force pull master from GitHub (safety mechanism)
+#
+# GUARANTEES:
+# - Dev branch preserved (safety branch before operations)
+# - Master has ZERO dev history (clean slate, whitelisted files only)
+# - Developers can git pull master without conflicts
+#
+# VERSION HISTORY:
+# 1.23.0 - Whitelisted copy built with git plumbing (ls-tree -z + private
+#          index + checkout-index), constant process count
+#        - UpdateMode=objects: --update/--deploy commit master with
+#          commit-tree, no checkout and no working tree rewrite
+#        - Parallel ZIP engine (ZipWorkers), ZIP64 aware
+#        - ZIP compression policy (store by extension, level, bzip2/lzma)
+#          with per-decision savings report
+#        - --full-backup --incremental (base + hash-keyed deltas) and
+#          --restore-backup DEST [--at POINT]
+#        - Whitelist compiled once (WhitelistMatcher); ZIP walks and
+#          ls-tree never descend into non-whitelisted folders
+#        - ReleaseWhiteList globs (* ? [..] **) and !negations, compiled
+#          into one include and one exclude regex
+#        - Git backend: argv lists (no shell), persistent cat-file
+#          --batch-check for ref lookups, per-run ref cache
+#        - Safety snapshot built on a private index (write-tree +
+#          commit-tree); user index and working tree never modified
+#        - Safety branch retention (SafetyKeepLast/Days/PruneMode) and
+#          --gc-safety
+#        - Buffered log writer with background flush and separate
+#          console/file level filters
+#        - Optional JSON-lines run journal (EnableJsonLog) with per-phase
+#          spans and subprocess events; --log-summary timing table
+#        - --profile: forks/time per git subcommand, bytes read/written by
+#          zip/wipe/copy, optional --cprofile; report saved next to the log
+#        - ZipSource=git: --zip / --release SOURCE ZIP streamed from the
+#          committed tree (ls-tree + one cat-file --batch), no disk walk
+#        - DeterministicZip (sorted members, fixed time, normalized modes)
+#          and ArtifactCacheDir: identical SOURCE/BIN content reuses the
+#          cached ZIP instead of compressing again
+#        - --update skips no-op publishes: filtered dev tree hash compared
+#          with ReleaseRemote/ReleaseBranch^{tree} first (--force overrides)
+#        - --project DIR (run against another folder) and --batch DIR...
+#          (dev sync / --zip / --update in many projects, BatchWorkers pool)
+#        - --release as a task graph: SOURCE/BIN ZIPs build in parallel
+#          with the push; each asset is uploaded as soon as it is ready
+#        - Remote ref cache: one "git ls-remote --heads" per remote per run
+#          instead of one per branch check; fetch skipped when the
+#          remote-tracking ref already matches the advertised head
+#        - UpdateMode=diff: --update/--deploy move the master worktree with
+#          a two-tree read-tree; only differing paths are written/removed
+#        - Incremental changelog: only commits since the last processed one
+#          (per branch, kept in the git dir), grouped by commit prefix and
+#          inserted with a streaming copy; CHANGELOG_DEV.md (DevChangelogPath)
+#        - Fast dev sync start: sync.py is a thin launcher that runs this
+#          module (sync_core.py) from a compiled copy kept in the git dir,
+#          heavy modules imported on first use, config and version cached
+#          in .git/sync-startup.json (keyed by file mtimes), read-only
+#          config load, log file only created when there is something to do
+#        - write_if_changed(): config, README, changelog, changelog state,
+#          backup manifest and startup cache are written atomically (temp
+#          file + os.replace) and only when their content changes
+#        - RepoStatus: one "git status --porcelain=v2 -z --branch" snapshot
+#          shared by dev sync, --update and DevSafetyGuard, dropped only
+#          when the tool changes the tree; UseFsMonitor runs git with
+#          core.fsmonitor + core.untrackedCache
+#        - bench_sync.py: offline benchmark on synthetic repos (wall time,
+#          processes, peak RSS, output size -> JSON/CSV)
+# 1.22.2 - Fixed fallback to version.txt if manifest.xml is missing or malformed
+#        - Improved logging of version resolution steps and outcomes
+# 1.22.1 - Fixed branch detection (uses actual current branch, not default)
+#        - Fixed log filename format: YYYY-MM-DD_HHMMSS_sync--command.log
+#        - Auto-detect project folder name for LocalFolderName at init
+#        - Create LogDir if it doesn't exist (including parent dirs)
+# 1.22.0 - CRITICAL FIX: --deploy now creates true orphan commit (ZERO parents)
+#        - Fixed: git index cleared before orphan commit
+#        - Fixed: LogDir dynamically protected (not hardcoded)
+#        - Version bumped in header for clarity
+# ==============================================================================
+
+import os
+import sys
+import re
+import argparse
+import subprocess
+import atexit
+import contextlib
+import threading
+import functools
+import io
+import json
+import struct
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timedelta
+
+# ==============================================================================
+# VERSION
+# ==============================================================================
+SCRIPT_VER = "1.23.0"
+
+# ==============================================================================
+# PATHS
+# ==============================================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(SCRIPT_DIR, "config_sync.ini")
+
+# ==============================================================================
+# PROTECTED FILES (never wiped during master clean)
+# Note: LogDir is protected dynamically in wipe functions
+# ==============================================================================
+PROTECTED_ITEMS_BASE = {".git", "config_sync.ini", "sync.py", "sync_core.py"}
+
+# ==============================================================================
+# UPDATE MODES (how --update / --deploy build the master commit)
+# ==============================================================================
+UPDATE_MODES = ("worktree", "objects", "diff")
+
+# ==============================================================================
+# ZIP SOURCES (where --zip / --release SOURCE ZIP read files from)
+# ==============================================================================
+ZIP_SOURCES = ("worktree", "git")
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+DEFAULT_CONFIG = {
+    "SETTINGS": {
+        "LocalFolderName":           os.path.basename(SCRIPT_DIR),
+        "RemoteProjectName":         os.path.basename(SCRIPT_DIR),
+        "DefaultVersion":            "0.1.0",
+        "DevRemote":                 "origin",
+        "ReleaseRemote":             "origin",
+        "DevBranch":                 "dev",
+        "ReleaseBranch":             "master",
+        "UpdateMode":                "worktree",
+        "ManifestPath":              "manifest.xml",
+        "ReadmePath":                "README.md",
+        "ReadmeVersionPattern":      r"(Version[:\s]+)([0-9\.]+)",
+        "ChangelogPath":             "CHANGELOG.md",
+        "DevChangelogPath":          "CHANGELOG_DEV.md",
+        "LogDir":                    "logs",
+        "VSCodePath":                r"c:\dev\VSCode\bin\code.cmd",
+        "ReleaseWhiteList":          "Plugin/, .gitignore, CHANGELOG.md, LICENSE, manifest.xml, README.md",
+        "BackupFormat":              "{date}_{time}_{type}_{project}_v{version}_{remote}_{branch}.zip",
+        "SafetyKeepLast":            "20",
+        "SafetyKeepDays":            "30",
+        "SafetyPruneMode":           "archive",
+        "SafetyArchiveKeepDays":     "180",
+        "BuildStagingDir":           "bin/Release",
+        "BinaryStagingDir":          "build_staging",
+        "ConsoleLogLevel":           "DEBUG",
+        "FileLogLevel":              "DEBUG",
+        "LogFlushInterval":          "1.0",
+        "BatchWorkers":              "4",
+        "EnableJsonLog":             "false",
+        "UseFsMonitor":              "false",
+        "EnableLoggingForZip":       "true",
+        "EnableLoggingForFullBackup":"true",
+        "ZipWorkers":                "0",
+        "ZipCompression":            "deflate",
+        "ZipCompressLevel":          "6",
+        "ZipStoreExtensions":        ".zip, .7z, .gz, .rar, .pack, .dll, .exe, .png, .jpg, .jpeg, .gif, .webp, .mp3, .mp4, .nupkg",
+        "ZipSource":                 "worktree",
+        "DeterministicZip":          "false",
+        "ArtifactCacheDir":          "",
+    }
+}
+
+CONFIG_COMMENTS = """\
+# ==============================================================================
+# MAMBA SYNC TOOL CONFIGURATION
+#
+# DefaultVersion:
+#   Project version fallback if manifest.xml is missing.
+#
+# ReadmeVersionPattern:
+#   Regex used to locate version string in README.md.
+#
+# ChangelogPath / DevChangelogPath:
+#   Public changelog (grouped by commit prefix) and the dev changelog
+#   (every commit incl. chore/other, with short hashes; keep it out of
+#   ReleaseWhiteList). Empty DevChangelogPath disables the dev changelog.
+#
+# ReleaseWhiteList:
+#   Files and folders included in LOCAL_ZIP and public releases.
+#   Rules (all paths are relative to the project root):
+#     - "SomeFolder/"       -> includes the folder and ALL its contents recursively
+#     - "README.md"         -> includes only that exact file (root level)
+#     - "docs/*.md"         -> glob: * ? [abc] stay inside one folder
+#     - "Plugin/**/*.xml"   -> glob: ** spans any number of folders
+#     - "!Plugin/**/*.pdb"  -> exclude; exclusions win over every include
+#
+# UpdateMode:
+#   How --update and --deploy build the public master commit.
+#     - "worktree" -> checkout master, wipe, copy whitelisted files, commit
+#     - "objects"  -> commit-tree straight from the dev tree; no checkout,
+#                     working tree and index are never touched
+#     - "diff"     -> checkout master, then move it to the whitelisted dev
+#                     tree touching only the paths that differ (unchanged
+#                     files keep inode and mtime), commit
+#
+# SafetyKeepLast / SafetyKeepDays / SafetyPruneMode:
+#   Retention for sync-safety-* branches (checked after every guarded run
+#   and by --gc-safety). A branch survives if it is one of the last N OR
+#   newer than D days. Expired branches are:
+#     - "archive" -> moved to refs/sync-safety/ (packed, hidden from git branch)
+#     - "delete"  -> deleted
+#     - "off"     -> never pruned automatically
+#
+# SafetyArchiveKeepDays:
+#   Archived refs under refs/sync-safety/ older than this many days are
+#   deleted by the same pruning pass (0 = keep archived refs forever).
+#
+# ConsoleLogLevel / FileLogLevel:
+#   Minimum level shown on console / written to the log file
+#   (DEBUG | INFO | WARN | ERROR).
+#
+# LogFlushInterval:
+#   Seconds between background flushes of the buffered log file
+#   (0 = write every line immediately). Always flushed on exit.
+#
+# BatchWorkers:
+#   Projects processed in parallel by --batch (each one is a separate
+#   sync.py process with its own config and logs).
+#
+# UseFsMonitor:
+#   true -> every git command of the run gets -c core.fsmonitor=true
+#   -c core.untrackedCache=true, so repeated status scans of big trees only
+#   look at what changed (needs a git with the builtin fsmonitor daemon,
+#   otherwise git silently does a normal scan).
+#
+# EnableJsonLog:
+#   Also write <log name>.jsonl next to the text log: one JSON event per
+#   line with phase spans (version, safety_guard, precheck, wipe, copy, commit,
+#   fetch, push, zip, upload), durations, file/byte counts and every
+#   subprocess with its exit code. Summarize with --log-summary.
+#
+# BinaryStagingDir:
+#   Directory containing compiled binaries for --release.
+#
+# ZipWorkers:
+#   Parallel compression threads for all ZIPs (0 = one per CPU core,
+#   1 = serial). Output is a standard ZIP either way.
+#
+# ZipCompression / ZipCompressLevel / ZipStoreExtensions:
+#   Compression policy for --zip, --full-backup and --release ZIPs.
+#     ZipCompression      deflate | store | bzip2 | lzma
+#     ZipCompressLevel    0-9 (deflate/bzip2 level, lzma preset)
+#     ZipStoreExtensions  already-compressed types, always STORED
+#   Members that do not shrink are STORED automatically.
+#
+# ZipSource:
+#   Where --zip and the --release SOURCE ZIP read whitelisted files from.
+#     - "worktree" -> walk the files on disk (includes uncommitted changes)
+#     - "git"      -> stream blobs of the committed tree (--zip: DevBranch,
+#                     --release: ReleaseBranch); exactly what was pushed
+#
+# DeterministicZip:
+#   true -> members sorted by name, every timestamp 1980-01-01 00:00,
+#   modes normalized (644 / 755 / symlink). Same content = same bytes.
+#
+# ArtifactCacheDir:
+#   Content-addressed cache for --zip and --release ZIPs (needs
+#   DeterministicZip=true; empty = off). Keyed by the blob hashes, modes
+#   and names of all members plus the compression policy; a hit copies
+#   the cached ZIP instead of compressing. Keep it OUTSIDE the project
+#   folder (e.g. ../.sync_artifacts), worktree updates wipe the project.
+#
+# BackupFormat placeholders:
+#   {date}     YYYY-MM-DD
+#   {time}     HHMMSS
+#   {type}     LOCAL_ZIP | FULL_BACKUP | DELTA_BACKUP | SOURCE | BIN
+#   {project}
+#   {version}
+#   {remote}
+#   {branch}
+# ==============================================================================
+
+"""
+
+# ==============================================================================
+# LOGGING
+# Lines go to the console immediately and into an in-memory buffer that a
+# background thread flushes every LogFlushInterval seconds. The buffer is
+# also flushed on exit (atexit covers sys.exit and unhandled exceptions).
+# ==============================================================================
+CURRENT_LOG_FILE = None
+
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARN": 30, "ERROR": 40}
+
+
+class LogWriter:
+    """Buffered log file writer with separate console/file level filters."""
+
+    def __init__(self):
+        self.fp             = None
+        self.pending        = None
+        self.buffer         = []
+        self.lock           = threading.RLock()
+        self.console_level  = LOG_LEVELS["DEBUG"]
+        self.file_level     = LOG_LEVELS["DEBUG"]
+        self.flush_interval = 1.0
+        self.stop           = threading.Event()
+        self.thread         = None
+
+    def configure(self, cfg):
+        self.console_level = self.parse_level(cfgget(cfg, "ConsoleLogLevel", "DEBUG"))
+        self.file_level    = self.parse_level(cfgget(cfg, "FileLogLevel", "DEBUG"))
+        try:
+            self.flush_interval = max(float(cfgget(cfg, "LogFlushInterval", "1.0")), 0.0)
+        except ValueError:
+            self.flush_interval = 1.0
+
+    @staticmethod
+    def parse_level(name):
+        return LOG_LEVELS.get(name.strip().upper(), LOG_LEVELS["DEBUG"])
+
+    def open(self, path, header="", deferred=False):
+        """
+        Start a new log file (truncates) and the background flusher.
+        deferred=True only buffers: the file is created by materialize()
+        (or the first ERROR line); if that never happens, close() drops
+        the buffer and no file is written.
+        """
+        self.close()
+        if deferred:
+            self.pending = (path, header)
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.fp = open(path, "w", encoding="utf-8")
+            self.fp.write(header)
+        except Exception:
+            self.fp = None
+            return
+        if self.flush_interval > 0:
+            self.stop.clear()
+            self.thread = threading.Thread(target=self.flush_loop, name="log-flush", daemon=True)
+            self.thread.start()
+
+    def write(self, line, level):
+        rank = LOG_LEVELS.get(level, LOG_LEVELS["INFO"])
+        with self.lock:
+            if rank >= self.console_level:
+                print(line)
+            if (self.fp is not None or self.pending) and rank >= self.file_level:
+                self.buffer.append(line + "\n")
+                if self.pending and rank >= LOG_LEVELS["ERROR"]:
+                    self.materialize()
+                if self.flush_interval == 0:
+                    self.flush()
+
+    def materialize(self):
+        """Create a deferred log file now, with everything buffered so far."""
+        with self.lock:
+            if self.pending:
+                path, header = self.pending
+                buffered     = self.buffer
+                self.buffer  = []
+                self.open(path, header)
+                self.buffer  = buffered + self.buffer
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.fp is None or not self.buffer:
+                return
+            try:
+                self.fp.write("".join(self.buffer))
+                self.fp.flush()
+            except Exception:
+                pass
+            self.buffer.clear()
+
+    def flush_loop(self):
+        while not self.stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join(timeout=5)
+            self.thread = None
+        with self.lock:
+            if self.pending:
+                self.pending = None
+                self.buffer.clear()
+            self.flush()
+            if self.fp is not None:
+                try:
+                    self.fp.close()
+                except Exception:
+                    pass
+                self.fp = None
+
+
+LOG = LogWriter()
+atexit.register(LOG.close)
+
+
+def log(msg, level="INFO"):
+    ts   = datetime.now().strftime("%H:%M:%S")
+    line = f"[{ts}] [{level}] {msg}"
+    if not line.isascii():
+        # raw (surrogateescape) path bytes cannot be printed or written as UTF-8
+        line = line.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
+    LOG.write(line, level)
+
+
+def log_excepthook(exc_type, exc_val, exc_tb):
+    """Put crash tracebacks into the log file before it is flushed on exit."""
+    import traceback
+    if not issubclass(exc_type, KeyboardInterrupt):
+        for line in "".join(traceback.format_exception(exc_type, exc_val, exc_tb)).splitlines():
+            log(line, "ERROR")
+    else:
+        log("Interrupted.", "ERROR")
+    LOG.close()
+
+
+sys.excepthook = log_excepthook
+
+
+# ==============================================================================
+# RUN JOURNAL
+# Optional machine-readable companion of the text log (EnableJsonLog): one
+# JSON object per line. Phases are spans (span_start / span_end with
+# duration, status and counters), nested per thread; every subprocess is an
+# "exec" event tagged with the span it ran in.
+# ==============================================================================
+class RunJournal:
+    """JSON-lines event writer with nested phase spans."""
+
+    def __init__(self):
+        self.fp      = None
+        self.path    = None
+        self.lock    = threading.Lock()
+        self.local   = threading.local()
+        self.next_id = 0
+        self.started = None
+
+    @property
+    def enabled(self):
+        return self.fp is not None
+
+    def open(self, path, command):
+        self.close()
+        try:
+            self.fp = open(path, "w", encoding="utf-8")
+        except Exception:
+            self.fp = None
+            return
+        self.path    = path
+        self.started = time.perf_counter()
+        self.event("run_start", command=command, version=SCRIPT_VER, pid=os.getpid())
+
+    def spans(self):
+        if not hasattr(self.local, "spans"):
+            self.local.spans = []
+        return self.local.spans
+
+    def event(self, kind, **fields):
+        if self.fp is None:
+            return
+        record = {"ts": datetime.now().isoformat(timespec="milliseconds"), "event": kind}
+        spans  = self.spans()
+        if spans and "span" not in fields:
+            record["phase"] = spans[-1]["phase"]
+            record["span"]  = spans[-1]["span"]
+        record.update(fields)
+        line = json.dumps(record, default=str)
+        with self.lock:
+            if self.fp is not None:
+                try:
+                    self.fp.write(line + "\n")
+                except Exception:
+                    pass
+
+    @contextlib.contextmanager
+    def span(self, phase, **fields):
+        """Record phase as span_start/span_end; status reflects how it ended."""
+        if self.fp is None:
+            yield
+            return
+        with self.lock:
+            self.next_id += 1
+            span_id = self.next_id
+        spans  = self.spans()
+        parent = spans[-1]["span"] if spans else None
+        self.event("span_start", phase=phase, span=span_id, parent=parent, **fields)
+        counters = {}
+        spans.append({"phase": phase, "span": span_id, "counters": counters})
+        start, status = time.perf_counter(), "ok"
+        try:
+            yield
+        except SystemExit as e:
+            if e.code:
+                status = f"exit {e.code}"
+            raise
+        except BaseException as e:
+            status = f"error {type(e).__name__}"
+            raise
+        finally:
+            spans.pop()
+            self.event("span_end", phase=phase, span=span_id, parent=parent, status=status,
+                       duration=round(time.perf_counter() - start, 4), **counters)
+
+    def count(self, **counters):
+        """Add counters (files, bytes, ...) to the innermost open span."""
+        if self.fp is None or not self.spans():
+            return
+        totals = self.spans()[-1]["counters"]
+        for key, value in counters.items():
+            totals[key] = totals.get(key, 0) + value
+
+    def close(self):
+        if self.fp is None:
+            return
+        self.event("run_end", duration=round(time.perf_counter() - self.started, 4))
+        with self.lock:
+            try:
+                self.fp.close()
+            except Exception:
+                pass
+            self.fp = None
+
+
+JOURNAL = RunJournal()
+atexit.register(JOURNAL.close)
+
+
+# ==============================================================================
+# PROFILING (--profile / --cprofile)
+# Every subprocess goes through exec_cmd (or the persistent cat-file), so
+# counting there gives exact fork numbers. I/O is accounted per phase by
+# the code that moves the bytes. The report is logged and saved next to
+# the run log as <log name>.profile.txt and .profile.json.
+# ==============================================================================
+class RunProfile:
+    """Fork/time accounting per subcommand and byte accounting per phase."""
+
+    def __init__(self):
+        self.enabled  = False
+        self.lock     = threading.Lock()
+        self.started  = None
+        self.command  = None
+        self.execs    = {}    # "git push" -> [calls, seconds]
+        self.io       = {}    # phase -> {"read": n, "written": n, "removed": n}
+        self.cprofile = None
+
+    def start(self, command, cpu=False):
+        self.enabled = True
+        self.command = command
+        self.started = time.perf_counter()
+        if cpu:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    @staticmethod
+    def exec_key(cmd):
+        if not cmd:
+            return "?"
+        if cmd[0] == "git":
+            return f"git {git_subcommand(cmd)}"
+        return os.path.basename(cmd[0])
+
+    def record_exec(self, cmd, seconds):
+        if not self.enabled:
+            return
+        key = self.exec_key(cmd)
+        with self.lock:
+            entry = self.execs.setdefault(key, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_io(self, phase, read=0, written=0, removed=0):
+        if not self.enabled:
+            return
+        with self.lock:
+            entry = self.io.setdefault(phase, {"read": 0, "written": 0, "removed": 0})
+            entry["read"]    += read
+            entry["written"] += written
+            entry["removed"] += removed
+
+    def report(self, base_path):
+        """Log the ranked report and write <base_path>.profile.txt / .json."""
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        wall  = time.perf_counter() - self.started
+        forks = sum(calls for calls, _ in self.execs.values())
+        spent = sum(seconds for _, seconds in self.execs.values())
+
+        lines = [
+            "=" * 70,
+            f"PROFILE {self.command}: wall {wall:.3f} s, {forks} processes "
+            f"({spent:.3f} s, {100 * spent / wall if wall else 0:.1f}% of wall)",
+            "-" * 70,
+            f"{'Subprocess':<28} {'Calls':>6} {'Total s':>9} {'Mean s':>9} {'% wall':>7}",
+        ]
+        for key, (calls, seconds) in sorted(self.execs.items(), key=lambda kv: -kv[1][1]):
+            lines.append(f"{key:<28} {calls:>6} {seconds:>9.3f} {seconds / calls:>9.4f} "
+                         f"{100 * seconds / wall if wall else 0:>6.1f}%")
+        if self.io:
+            lines += ["-" * 70,
+                      f"{'I/O phase':<28} {'Read MB':>10} {'Written MB':>11} {'Removed MB':>11}"]
+            for phase, entry in sorted(self.io.items()):
+                lines.append(f"{phase:<28} {entry['read'] / 1048576:>10.2f} "
+                             f"{entry['written'] / 1048576:>11.2f} {entry['removed'] / 1048576:>11.2f}")
+        hotspots = ""
+        if self.cprofile is not None:
+            import pstats
+            out = io.StringIO()
+            pstats.Stats(self.cprofile, stream=out).sort_stats("cumulative").print_stats(25)
+            hotspots = out.getvalue()
+            lines += ["-" * 70, "cProfile: top 25 by cumulative time"]
+            lines += [l for l in hotspots.splitlines() if l.strip()]
+        lines.append("=" * 70)
+
+        for line in lines:
+            log(line, "INFO")
+
+        data = {
+            "command":    self.command,
+            "version":    SCRIPT_VER,
+            "wall":       round(wall, 4),
+            "forks":      forks,
+            "subprocess": {k: {"calls": c, "seconds": round(t, 4)} for k, (c, t) in self.execs.items()},
+            "io":         self.io,
+        }
+        try:
+            with open(base_path + ".profile.txt", "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            with open(base_path + ".profile.json", "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            log(f"Profile saved: {base_path}.profile.txt / .profile.json", "INFO")
+        except OSError as e:
+            log(f"Could not save profile: {e}", "ERROR")
+
+
+PROFILE = RunProfile()
+
+
+def write_log_header(command, log_file_path, deferred=False):
+    """Write header to log file with command, version, and path."""
+    header = f"""\
+================================================================================
+MAMBA SYNC TOOL v{SCRIPT_VER}
+Command: {command}
+Log file: {log_file_path}
+Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+================================================================================
+
+"""
+    LOG.open(log_file_path, header, deferred=deferred)
+
+
+# ==============================================================================
+# FILE UPDATES
+# Every metadata file (config, README, changelogs, manifests, caches) is
+# written through write_if_changed(): identical content is never rewritten,
+# so mtime and inode stay and git status / file watchers see nothing, and new
+# content goes to a temp file next to the target that is os.replace()d in.
+# Readers never see a half-written file.
+# ==============================================================================
+@contextlib.contextmanager
+def atomic_write(path, mode="w", **kwargs):
+    """
+    open() a temp file next to path; on success it replaces path (keeping
+    its permission bits), on error it is removed and path is untouched.
+    """
+    path = os.path.realpath(path)
+    tmp  = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, mode, **kwargs) as f:
+            yield f
+        if os.path.exists(path):
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp, path)
+        STATUS.invalidate()
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+def write_if_changed(path, content):
+    """
+    Write content (str: UTF-8, platform newlines like open(path, "w");
+    bytes: as is) to path unless it already holds exactly that.
+    Returns True if the file was written.
+    """
+    data = content.replace("\n", os.linesep).encode("utf-8") if isinstance(content, str) else content
+    try:
+        old_size = os.path.getsize(path)
+    except OSError:
+        old_size = None
+    if old_size == len(data):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                log(f"Unchanged, not rewritten: {path}", "DEBUG")
+                JOURNAL.event("file", path=path, changed=False)
+                return False
+
+    with atomic_write(path, "wb") as f:
+        f.write(data)
+    before = "new" if old_size is None else f"{old_size} bytes"
+    log(f"Written: {path} ({before} -> {len(data)} bytes)", "DEBUG")
+    JOURNAL.event("file", path=path, changed=True, bytes=len(data))
+    return True
+
+
+# ==============================================================================
+# CONFIG LOADER
+# ==============================================================================
+def config_text(cfg):
+    out = io.StringIO()
+    cfg.write(out)
+    return CONFIG_COMMENTS + out.getvalue()
+
+
+def load_and_sync_config(write=True):
+    """
+    Read config_sync.ini and add missing default keys. write=False keeps
+    the added keys in memory only (the file is never rewritten).
+    """
+    import configparser
+    if not os.path.exists(CONFIG_FILE):
+        cfg = configparser.ConfigParser()
+        cfg.read_dict(DEFAULT_CONFIG)
+        write_if_changed(CONFIG_FILE, config_text(cfg))
+        print("Default config created. Please review config_sync.ini.")
+        sys.exit(0)
+
+    cfg = configparser.ConfigParser()
+    cfg.read(CONFIG_FILE, encoding="utf-8")
+
+    if "SETTINGS" not in cfg:
+        cfg["SETTINGS"] = {}
+
+    updated = False
+    for k, v in DEFAULT_CONFIG["SETTINGS"].items():
+        if k not in cfg["SETTINGS"]:
+            cfg["SETTINGS"][k] = v
+            updated = True
+
+    if updated and write and write_if_changed(CONFIG_FILE, config_text(cfg)):
+        log("Config updated with new default keys.", "DEBUG")
+
+    return cfg["SETTINGS"]
+
+
+def cfgget(cfg, key, default=""):
+    """Case-insensitive config get with fallback."""
+    v = cfg.get(key.lower()) or cfg.get(key)
+    return v if v else default
+
+
+def get_protected_items(cfg):
+    """Get protected items including dynamic LogDir."""
+    log_dir = cfgget(cfg, "LogDir", "logs")
+    # Split path to get top-level directory (e.g., "doc/logs" -> "doc")
+    log_dir_root = log_dir.split('/')[0].split('\\')[0]
+    protected = PROTECTED_ITEMS_BASE.copy()
+    protected.add(log_dir_root)  # Protect entire log directory tree
+    return protected
+
+
+# ==============================================================================
+# STARTUP CACHE
+# The plain dev sync is fired from editor save hooks many times an hour. Its
+# parsed settings and resolved version are kept in .git/sync-startup.json,
+# each keyed by the (mtime, size) of the files it was derived from, so a warm
+# start needs neither configparser nor an XML parse.
+# ==============================================================================
+STARTUP_CACHE = "sync-startup.json"
+
+
+def file_stamp(path):
+    """[mtime_ns, size] of path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+class StartupCache:
+    """Small JSON cache of derived values, each valid while its stamps match."""
+
+    def __init__(self):
+        git_dir    = os.path.join(SCRIPT_DIR, ".git")
+        self.path  = os.path.join(git_dir, STARTUP_CACHE) if os.path.isdir(git_dir) else None
+        self.data  = {}
+        self.dirty = False
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                self.data = {}
+
+    def get(self, key, stamps):
+        entry = self.data.get(key)
+        if entry and entry.get("version") == SCRIPT_VER and entry.get("stamps") == stamps:
+            return entry["value"]
+        return None
+
+    def put(self, key, stamps, value):
+        self.data[key] = {"version": SCRIPT_VER, "stamps": stamps, "value": value}
+        self.dirty     = True
+
+    def save(self):
+        if not self.dirty or not self.path:
+            return
+        try:
+            write_if_changed(self.path, json.dumps(self.data))
+        except OSError as e:
+            log(f"Startup cache not saved: {e}", "DEBUG")
+        self.dirty = False
+
+
+def load_config_cached(cache):
+    """Read-only settings, from the cache while sync.py and the config are unchanged."""
+    stamps = [file_stamp(os.path.abspath(__file__)), file_stamp(CONFIG_FILE)]
+    cfg    = cache.get("config", stamps)
+    if cfg is None:
+        cfg = dict(load_and_sync_config(write=False))
+        cache.put("config", stamps, cfg)
+    return cfg
+
+
+def resolve_version_cached(cfg, cache):
+    """resolve_version(), cached while the config, manifest and version.txt are unchanged."""
+    stamps  = [file_stamp(CONFIG_FILE),
+               file_stamp(cfgget(cfg, "ManifestPath", "manifest.xml")),
+               file_stamp(os.path.join(SCRIPT_DIR, "version.txt"))]
+    version = cache.get("version", stamps)
+    if version is None:
+        version = resolve_version(cfg)
+        cache.put("version", stamps, version)
+    else:
+        log(f"Version from startup cache: {version}", "DEBUG")
+    return version
+
+
+# ==============================================================================
+# VERSION RESOLUTION
+# ==============================================================================
+def resolve_version(cfg):
+    """
+    Priority:
+    1. manifest.xml (Version node)
+    2. version.txt (Plain text)
+    3. config_sync.ini (DefaultVersion)
+    """
+    import xml.etree.ElementTree as ET
+    # 1. Check manifest.xml
+    manifest = cfgget(cfg, "ManifestPath", "manifest.xml")
+    if os.path.exists(manifest):
+        try:
+            tree = ET.parse(manifest)
+            node = tree.getroot().find("Version")
+            if node is not None and node.text:
+                v = node.text.strip()
+                log(f"Version resolved from manifest.xml: {v}", "DEBUG")
+                return v
+        except Exception as e:
+            log(f"Manifest read failed: {e}", "ERROR")
+
+    # 2. Check version.txt
+    version_file = os.path.join(SCRIPT_DIR, "version.txt")
+    if os.path.exists(version_file):
+        try:
+            with open(version_file, "r", encoding="utf-8") as f:
+                v = f.read().strip()
+                if v:
+                    log(f"Version resolved from version.txt: {v}", "DEBUG")
+                    return v
+        except Exception as e:
+            log(f"version.txt read failed: {e}", "ERROR")
+
+    # 3. Fallback to config
+    ver = cfgget(cfg, "DefaultVersion", "0.1.0")
+    log(f"Version resolved from DefaultVersion: {ver}", "DEBUG")
+    return ver
+
+
+# ==============================================================================
+# README UPDATE
+# ==============================================================================
+def update_readme(cfg, version):
+    path    = cfgget(cfg, "ReadmePath", "README.md")
+    pattern = cfgget(cfg, "ReadmeVersionPattern", r"(Version[:\s]+)([0-9\.]+)")
+    if not os.path.exists(path):
+        log("README not found, skipping update.", "DEBUG")
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        txt = f.read()
+    new_txt, count = re.subn(pattern, rf"\g<1>{version}", txt)
+    if count == 0:
+        log("README version pattern not found, applying generic fallback.", "DEBUG")
+        new_txt = re.sub(r"\d+\.\d+\.\d+", version, txt, count=1)
+    if write_if_changed(path, new_txt):
+        log(f"README updated to version {version}.", "DEBUG")
+    else:
+        log(f"README already at version {version}.", "DEBUG")
+
+
+# ==============================================================================
+# WHITELIST MATCHING
+# Entries are compiled once per run into two combined regexes (include and
+# exclude) plus the set of folders worth descending into.
+#   "Folder/"          -> folder and everything below it
+#   "README.md"        -> exact path from project root
+#   "docs/*.md"        -> glob (* ? [..] within a folder, ** across folders)
+#   "!Plugin/**/*.pdb" -> exclude; exclusions always win over includes
+# All patterns are anchored at the project root.
+# ==============================================================================
+GLOB_CHARS = "*?["
+
+
+def glob_to_regex(pattern):
+    """Translate one whitelist pattern into a regex fragment (anchored by caller)."""
+    out = []
+    i   = 0
+    n   = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = pattern.find("]", i + 2)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j].replace("\\", "\\\\")
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = j
+        else:
+            out.append(re.escape(c))
+        i += 1
+    if pattern.endswith("/"):
+        out.append(".*")
+    return "".join(out)
+
+
+def pattern_scope(pattern):
+    """
+    Where a pattern can match:
+      ("file", path)    literal file
+      ("deep", folder)  anything below folder ("" = whole tree)
+      ("flat", folder)  only files directly inside folder
+    """
+    if not any(ch in pattern for ch in GLOB_CHARS):
+        if pattern.endswith("/"):
+            return "deep", pattern.rstrip("/")
+        return "file", pattern
+    parts = pattern.rstrip("/").split("/")
+    base  = []
+    for part in parts:
+        if any(ch in part for ch in GLOB_CHARS):
+            break
+        base.append(part)
+    rest = parts[len(base):]
+    if len(rest) == 1 and "**" not in rest[0] and not pattern.endswith("/"):
+        return "flat", "/".join(base)
+    return "deep", "/".join(base)
+
+
+class WhitelistMatcher:
+    """
+    ReleaseWhiteList compiled once: one include regex, one exclude regex.
+    matches() costs one regex pass over the path regardless of pattern count;
+    may_contain() lets directory walks prune every folder that cannot hold
+    a whitelisted file.
+    """
+
+    def __init__(self, entries):
+        self.entries  = list(entries)
+        includes      = [e for e in self.entries if not e.startswith("!")]
+        excludes      = [e[1:] for e in self.entries if e.startswith("!") and len(e) > 1]
+        self.include  = self.combine(includes)
+        self.exclude  = self.combine(excludes)
+
+        # Folders that may hold matches: deep bases, flat folders, ancestors
+        self.files     = set()
+        self.dirs      = set()
+        self.flat      = set()
+        for kind, path in map(pattern_scope, includes):
+            {"file": self.files, "deep": self.dirs, "flat": self.flat}[kind].add(path)
+        self.ancestors = set()
+        for parts in ([e.split("/")[:-1] for e in self.files | self.dirs] +
+                      [f.split("/") if f else [] for f in self.flat]):
+            for i in range(1, len(parts) + 1):
+                self.ancestors.add("/".join(parts[:i]))
+
+    @staticmethod
+    def combine(patterns):
+        if not patterns:
+            return None
+        return re.compile("(?:" + "|".join(glob_to_regex(p) for p in patterns) + r")\Z")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return repr(self.entries)
+
+    def under_dir(self, rel_path):
+        """True if rel_path lies inside a folder that may hold includes."""
+        if "" in self.dirs:
+            return True
+        i = rel_path.find("/")
+        while i != -1:
+            if rel_path[:i] in self.dirs:
+                return True
+            i = rel_path.find("/", i + 1)
+        return False
+
+    def excluded(self, rel_path):
+        return self.exclude is not None and self.exclude.match(rel_path) is not None
+
+    def matches(self, rel_path):
+        if self.include is None or self.include.match(rel_path) is None:
+            return False
+        return not self.excluded(rel_path)
+
+    def may_contain(self, rel_dir):
+        """True if directory rel_dir can contain whitelisted files."""
+        if self.excluded(rel_dir + "/"):
+            return False
+        return (rel_dir in self.dirs or rel_dir in self.ancestors
+                or self.under_dir(rel_dir + "/"))
+
+    def pathspecs(self):
+        """Literal paths for git commands (limits ls-tree to whitelisted trees)."""
+        if "" in self.dirs or "" in self.flat:
+            return []
+        return sorted(self.files | {d + "/" for d in self.dirs | self.flat})
+
+
+@functools.lru_cache(maxsize=None)
+def compiled_whitelist(entries):
+    return WhitelistMatcher(entries)
+
+
+def compile_whitelist(whitelist):
+    """Compile a whitelist (list of entries) once per run; matchers pass through."""
+    if isinstance(whitelist, WhitelistMatcher):
+        return whitelist
+    return compiled_whitelist(tuple(whitelist))
+
+
+def parse_whitelist(cfg):
+    raw = cfgget(cfg, "ReleaseWhiteList", "")
+    return compile_whitelist([e.strip() for e in raw.split(",") if e.strip()])
+
+
+# ==============================================================================
+# ZIP ENGINE
+# Members are compressed in a thread pool (zlib/bz2/lzma release the GIL) into
+# spooled temp files and written to the archive strictly in submission order.
+# Output is a plain PKZIP archive (ZIP64 when needed), readable by any unzip.
+# The archive is built under a temp name and renamed into place on success.
+# ==============================================================================
+ZIP_CHUNK      = 1024 * 1024
+ZIP_SPOOL_MAX  = 8 * 1024 * 1024
+# memory budget of all members in flight (spools kept in RAM + in-memory sources)
+ZIP_INFLIGHT_MAX = 64 * 1024 * 1024
+# ZIP64 thresholds; at or above them the 32/16 bit field holds the marker
+# (all bits set) and the real value goes to the ZIP64 extra / end record
+ZIP_MAX_32     = 0xFFFFFFFF
+ZIP_MAX_16     = 0xFFFF
+ZIP_MARK_32    = 0xFFFFFFFF
+ZIP_MARK_16    = 0xFFFF
+
+ZIP_LOCAL      = struct.Struct("<IHHHHHIIIHH")
+ZIP_CENTRAL    = struct.Struct("<IHHHHHHIIIHHHHHII")
+ZIP_EOCD       = struct.Struct("<IHHHHIIH")
+ZIP64_EOCD     = struct.Struct("<IQHHIIQQQQ")
+ZIP64_LOCATOR  = struct.Struct("<IIQI")
+
+# PKZIP compression method ids (same values as zipfile.ZIP_*)
+ZIP_STORED     = 0
+ZIP_DEFLATED   = 8
+ZIP_BZIP2      = 12
+ZIP_LZMA       = 14
+
+ZIP_METHODS = {
+    "store":   ZIP_STORED,
+    "deflate": ZIP_DEFLATED,
+    "bzip2":   ZIP_BZIP2,
+    "lzma":    ZIP_LZMA,
+}
+ZIP_METHOD_NAMES = {v: k for k, v in ZIP_METHODS.items()}
+ZIP_METHOD_VERSION = {
+    ZIP_STORED:   10,
+    ZIP_DEFLATED: 20,
+    ZIP_BZIP2:    46,
+    ZIP_LZMA:     63,
+}
+# LZMA dictionary size per preset (lc=3, lp=0, pb=2 for all presets)
+LZMA_DICT_SIZES = (1 << 18, 1 << 20, 1 << 21, 1 << 22, 1 << 22,
+                   1 << 23, 1 << 23, 1 << 24, 1 << 25, 1 << 26)
+
+
+def zip_workers(cfg):
+    """ZipWorkers from config (0 = one per CPU core)."""
+    raw = cfgget(cfg, "ZipWorkers", "0")
+    try:
+        workers = int(raw)
+    except ValueError:
+        log(f"Invalid ZipWorkers '{raw}', using 1.", "ERROR")
+        return 1
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def zip_dos_datetime(mtime):
+    """(dostime, dosdate) for a POSIX timestamp, clamped to 1980."""
+    t = datetime.fromtimestamp(mtime)
+    if t.year < 1980:
+        return 0, (1 << 5) | 1
+    dostime = (t.hour << 11) | (t.minute << 5) | (t.second // 2)
+    dosdate = ((t.year - 1980) << 9) | (t.month << 5) | t.day
+    return dostime, dosdate
+
+
+class ZipPolicy:
+    """
+    Per-member compression decision.
+    Extensions in store_ext are always STORED; everything else uses method.
+    Members that do not shrink are re-emitted as STORED.
+    """
+
+    def __init__(self, method="deflate", level=6, store_ext=()):
+        self.method    = ZIP_METHODS[method]
+        self.level     = level
+        self.store_ext = {e.lower() for e in store_ext}
+
+    def choose(self, arcname):
+        """Return (zip method, decision label) for a member."""
+        if self.method == ZIP_STORED:
+            return ZIP_STORED, "stored (policy)"
+        if os.path.splitext(arcname)[1].lower() in self.store_ext:
+            return ZIP_STORED, "stored (extension)"
+        return self.method, ZIP_METHOD_NAMES[self.method]
+
+
+def zip_policy(cfg):
+    """Build ZipPolicy from ZipCompression / ZipCompressLevel / ZipStoreExtensions."""
+    method = cfgget(cfg, "ZipCompression", "deflate").strip().lower()
+    if method not in ZIP_METHODS:
+        log(f"Invalid ZipCompression '{method}'. Use one of: {', '.join(ZIP_METHODS)}", "ERROR")
+        sys.exit(1)
+    if method in ("bzip2", "lzma"):
+        try:
+            __import__("bz2" if method == "bzip2" else "lzma")
+        except ImportError:
+            log(f"ZipCompression={method} is not available in this Python build.", "ERROR")
+            sys.exit(1)
+
+    raw_level = cfgget(cfg, "ZipCompressLevel", "6")
+    try:
+        level = min(max(int(raw_level), 0), 9)
+    except ValueError:
+        log(f"Invalid ZipCompressLevel '{raw_level}', using 6.", "ERROR")
+        level = 6
+
+    raw_ext   = cfgget(cfg, "ZipStoreExtensions", "")
+    store_ext = [e.strip() if e.strip().startswith(".") else "." + e.strip()
+                 for e in raw_ext.split(",") if e.strip()]
+    return ZipPolicy(method, level, store_ext)
+
+
+def zip_options(cfg):
+    """Keyword arguments for create_zip() / ParallelZipWriter taken from config."""
+    return {"workers":       zip_workers(cfg),
+            "policy":        zip_policy(cfg),
+            "deterministic": cfgget(cfg, "DeterministicZip", "false").lower() == "true"}
+
+
+def zip_normalized_mode(mode):
+    """Mode as stored by DeterministicZip: symlink, 755 or 644 regular file."""
+    if mode & 0o170000 == 0o120000:
+        return 0o120777
+    return 0o100755 if mode & 0o111 else 0o100644
+
+
+def zip_field(value, limit, mark):
+    """Value for a 32/16 bit header field: the ZIP64 marker once value reaches limit."""
+    return mark if value >= limit else value
+
+
+def zip_compressor(method, level):
+    """
+    Return (compressor, header bytes) for a ZIP method.
+    compressor has compress()/flush(); header is written before the data.
+    """
+    if method == ZIP_DEFLATED:
+        return zlib.compressobj(level, zlib.DEFLATED, -15), b""
+    if method == ZIP_BZIP2:
+        import bz2
+        return bz2.BZ2Compressor(max(level, 1)), b""
+    if method == ZIP_LZMA:
+        import lzma
+        dict_size = LZMA_DICT_SIZES[level]
+        comp  = lzma.LZMACompressor(lzma.FORMAT_RAW, filters=[
+            {"id": lzma.FILTER_LZMA1, "preset": level, "dict_size": dict_size}])
+        props = bytes([(2 * 5 + 0) * 9 + 3]) + struct.pack("<I", dict_size)
+        return comp, struct.pack("<BBH", 9, 4, len(props)) + props
+    raise ValueError(f"Unsupported ZIP method: {method}")
+
+
+def open_source(source):
+    """Open a member source: a file path or in-memory bytes."""
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    return open(source, "rb")
+
+
+def store_file(source):
+    """Worker: copy one member into a spooled temp file. Returns (crc, size, spool)."""
+    import tempfile
+    spool = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX)
+    crc   = 0
+    size  = 0
+    with open_source(source) as f:
+        while True:
+            chunk = f.read(ZIP_CHUNK)
+            if not chunk:
+                break
+            crc   = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(chunk)
+    spool.seek(0)
+    return crc, size, spool
+
+
+def compress_file(source, method, level):
+    """
+    Worker: compress one member (path or bytes) into a spooled temp file.
+    Falls back to STORED when compression does not shrink the member.
+    Returns (method, crc, file_size, compress_size, attempted_size, spool).
+    """
+    import tempfile
+    if method == ZIP_STORED:
+        crc, size, spool = store_file(source)
+        return method, crc, size, size, size, spool
+
+    comp, header = zip_compressor(method, level)
+    spool = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX)
+    spool.write(header)
+    crc   = 0
+    size  = 0
+    with open_source(source) as f:
+        while True:
+            chunk = f.read(ZIP_CHUNK)
+            if not chunk:
+                break
+            crc   = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(comp.compress(chunk))
+    spool.write(comp.flush())
+    compress_size = spool.tell()
+
+    if compress_size >= size and size > 0:
+        spool.close()
+        crc, size, spool = store_file(source)
+        return ZIP_STORED, crc, size, size, compress_size, spool
+
+    spool.seek(0)
+    return method, crc, size, compress_size, compress_size, spool
+
+
+def fmt_mb(n):
+    return f"{n / (1024 * 1024):.2f} MB"
+
+
+def zip_name(arcname):
+    """
+    (name bytes, UTF-8 flag) of a member. Raw path bytes (surrogateescape,
+    not valid UTF-8) are stored as is, without the UTF-8 flag.
+    """
+    name = arcname.encode("utf-8", "surrogateescape")
+    if arcname.isascii():
+        return name, False
+    try:
+        arcname.encode("utf-8")
+    except UnicodeEncodeError:
+        return name, False
+    return name, True
+
+
+def zip_member_path(info):
+    """Inverse of zip_name() for a zipfile.ZipInfo: the arcname as we wrote it."""
+    raw = info.orig_filename.encode("utf-8" if info.flag_bits & 0x800 else "cp437")
+    return raw.decode("utf-8", "surrogateescape")
+
+
+class ParallelZipWriter:
+    """
+    Streaming ZIP writer with a pool of compression workers.
+    add_file() schedules a member, close() drains the pool, writes the
+    central directory and renames the temp file to path; abort() removes
+    it, so an interrupted run never leaves a truncated archive at path.
+    At most 2 x workers members and ZIP_INFLIGHT_MAX bytes of memory are
+    in flight.
+    stats maps decision label -> [files, input bytes, output bytes, attempted bytes].
+    deterministic=True pins every timestamp to 1980-01-01 and normalizes
+    modes; callers add members in sorted order.
+    """
+
+    def __init__(self, path, workers=1, policy=None, deterministic=False):
+        from concurrent.futures import ThreadPoolExecutor
+        self.path          = os.path.realpath(path)
+        self.tmp           = f"{self.path}.{os.getpid()}.tmp"
+        self.fp            = open(self.tmp, "wb")
+        self.policy        = policy or ZipPolicy()
+        self.deterministic = deterministic
+        self.workers       = max(1, workers)
+        self.pool     = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+        self.pending  = deque()
+        self.inflight = 0
+        self.central  = []
+        self.stats    = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            try:
+                self.close()
+            except BaseException:
+                self.abort()
+                raise
+        else:
+            self.abort()
+        return False
+
+    def add_file(self, full_path, arcname):
+        st = os.stat(full_path)
+        self.schedule(full_path, arcname, st.st_mtime, st.st_mode, min(st.st_size, ZIP_SPOOL_MAX))
+
+    def add_bytes(self, data, arcname, mtime=None, mode=0o100644):
+        data = bytes(data)
+        self.schedule(data, arcname, datetime.now().timestamp() if mtime is None else mtime,
+                      mode, len(data) + min(len(data), ZIP_SPOOL_MAX))
+
+    def schedule(self, source, arcname, mtime, mode, cost):
+        """
+        Queue one member. cost: memory it holds until written (in-memory
+        source + the part of its spool that stays in RAM).
+        """
+        if self.deterministic:
+            mtime, mode = 0, zip_normalized_mode(mode)
+        method, decision = self.policy.choose(arcname)
+        args = (source, method, self.policy.level)
+        if self.pool is None:
+            self.write_member(arcname, mtime, mode, decision, compress_file(*args))
+            return
+        # make room first: a member bigger than the budget runs alone
+        while self.pending and (len(self.pending) >= self.workers * 2 or
+                                self.inflight + cost > ZIP_INFLIGHT_MAX):
+            self.write_next()
+        future = self.pool.submit(compress_file, *args)
+        self.pending.append((arcname, mtime, mode, decision, cost, future))
+        self.inflight += cost
+
+    def write_next(self):
+        arcname, mtime, mode, decision, cost, future = self.pending.popleft()
+        self.write_member(arcname, mtime, mode, decision, future.result())
+        self.inflight -= cost
+
+    def write_member(self, arcname, mtime, mode, decision, result):
+        import shutil
+        method, crc, size, compress_size, attempted, spool = result
+        if method == ZIP_STORED and attempted != size:
+            decision = "stored (no gain)"
+        entry = self.stats.setdefault(decision, [0, 0, 0, 0])
+        entry[0] += 1
+        entry[1] += size
+        entry[2] += compress_size
+        entry[3] += attempted
+
+        name, utf8 = zip_name(arcname)
+        flags   = (0x800 if utf8 else 0) | (0x02 if method == ZIP_LZMA else 0)
+        dostime, dosdate = zip_dos_datetime(mtime)
+        offset  = self.fp.tell()
+        zip64   = size >= ZIP_MAX_32 or compress_size >= ZIP_MAX_32
+        extra   = struct.pack("<HHQQ", 1, 16, size, compress_size) if zip64 else b""
+        needed  = max(ZIP_METHOD_VERSION[method], 45 if zip64 else 0)
+
+        self.fp.write(ZIP_LOCAL.pack(
+            0x04034B50, needed, flags, method, dostime, dosdate, crc,
+            ZIP_MARK_32 if zip64 else compress_size,
+            ZIP_MARK_32 if zip64 else size,
+            len(name), len(extra)))
+        self.fp.write(name)
+        self.fp.write(extra)
+        with spool:
+            shutil.copyfileobj(spool, self.fp, ZIP_CHUNK)
+
+        self.central.append((name, flags, method, dostime, dosdate, crc,
+                             compress_size, size, offset, (mode & 0xFFFF) << 16))
+
+    def close(self):
+        while self.pending:
+            self.write_next()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+        cd_offset = self.fp.tell()
+        made_by   = ((3 if self.deterministic or os.name != "nt" else 0) << 8) | 63
+        for name, flags, method, dostime, dosdate, crc, csize, size, offset, attr in self.central:
+            fields = [v for v in (size, csize, offset) if v >= ZIP_MAX_32]
+            extra  = struct.pack("<HH", 1, 8 * len(fields)) + struct.pack(f"<{len(fields)}Q", *fields) \
+                     if fields else b""
+            needed = max(ZIP_METHOD_VERSION[method], 45 if fields else 0)
+            self.fp.write(ZIP_CENTRAL.pack(
+                0x02014B50, made_by, needed, flags, method,
+                dostime, dosdate, crc,
+                zip_field(csize, ZIP_MAX_32, ZIP_MARK_32), zip_field(size, ZIP_MAX_32, ZIP_MARK_32),
+                len(name), len(extra), 0, 0, 0, attr, zip_field(offset, ZIP_MAX_32, ZIP_MARK_32)))
+            self.fp.write(name)
+            self.fp.write(extra)
+        cd_end  = self.fp.tell()
+        cd_size = cd_end - cd_offset
+        count   = len(self.central)
+
+        if count >= ZIP_MAX_16 or cd_offset >= ZIP_MAX_32 or cd_size >= ZIP_MAX_32:
+            self.fp.write(ZIP64_EOCD.pack(
+                0x06064B50, 44, made_by, 45, 0, 0, count, count, cd_size, cd_offset))
+            self.fp.write(ZIP64_LOCATOR.pack(0x07064B50, 0, cd_end, 1))
+        self.fp.write(ZIP_EOCD.pack(
+            0x06054B50, 0, 0,
+            zip_field(count, ZIP_MAX_16, ZIP_MARK_16), zip_field(count, ZIP_MAX_16, ZIP_MARK_16),
+            zip_field(cd_size, ZIP_MAX_32, ZIP_MARK_32), zip_field(cd_offset, ZIP_MAX_32, ZIP_MARK_32), 0))
+        self.fp.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        for *_, future in self.pending:
+            future.cancel()
+        if self.pool is not None:
+            self.pool.shutdown()
+        for *_, future in self.pending:
+            if not future.cancelled() and future.exception() is None:
+                future.result()[-1].close()
+        self.fp.close()
+        with contextlib.suppress(OSError):
+            os.remove(self.tmp)
+
+    def report(self):
+        """Log how many bytes each compression decision saved."""
+        if not self.stats:
+            return
+        log("Compression report:", "INFO")
+        for decision, (files, size, csize, attempted) in sorted(self.stats.items()):
+            if decision == "stored (no gain)":
+                detail = f"{fmt_mb(size)} kept raw (saved {fmt_mb(attempted - size)} vs compressed)"
+            elif decision.startswith("stored"):
+                detail = f"{fmt_mb(size)} kept raw (compression skipped)"
+            else:
+                detail = f"{fmt_mb(size)} -> {fmt_mb(csize)} (saved {fmt_mb(size - csize)})"
+            log(f"  {decision:<19}: {files} files, {detail}", "INFO")
+
+
+# ==============================================================================
+# ZIP CREATION
+# ==============================================================================
+def create_zip(source_dir, output_path, whitelist=None, include_git=False,
+               workers=1, policy=None, deterministic=False, cache_dir=None):
+    output_path_abs = os.path.abspath(output_path)
+    source_dir_abs  = os.path.abspath(source_dir)
+    log(f"Creating ZIP  : {output_path_abs}", "DEBUG")
+    log(f"  Source      : {source_dir_abs}", "DEBUG")
+    log(f"  Whitelist   : {whitelist if whitelist is not None else 'ALL (no filter)'}", "DEBUG")
+    log(f"  Include .git: {include_git}", "DEBUG")
+    log(f"  Workers     : {workers}", "DEBUG")
+
+    matcher = compile_whitelist(whitelist) if whitelist is not None else None
+
+    with JOURNAL.span("zip", archive=os.path.basename(output_path_abs)):
+        members = []
+        for root, dirs, files in os.walk(source_dir_abs):
+            if not include_git:
+                dirs[:] = [d for d in dirs if d != ".git"]
+            if matcher is not None:
+                rel_root = os.path.relpath(root, source_dir_abs).replace("\\", "/")
+                prefix   = "" if rel_root == "." else rel_root + "/"
+                dirs[:]  = [d for d in dirs if matcher.may_contain(prefix + d)]
+
+            for filename in files:
+                full = os.path.join(root, filename)
+                if os.path.abspath(full) == output_path_abs:
+                    continue
+                rel = os.path.relpath(full, source_dir_abs).replace("\\", "/")
+                if matcher is not None:
+                    if not matcher.matches(rel):
+                        continue
+                members.append((full, rel))
+        if deterministic:
+            members.sort(key=lambda m: m[1])
+
+        key = None
+        if cache_dir is not None:
+            listing = worktree_listing(members)
+            key     = artifact_key(listing, policy) if listing is not None else None
+            if key and fetch_artifact(cache_dir, key, output_path_abs):
+                JOURNAL.count(files=len(members), bytes=os.path.getsize(output_path_abs), cached=1)
+                return
+
+        with ParallelZipWriter(output_path_abs, workers=workers, policy=policy,
+                               deterministic=deterministic) as z:
+            for full, rel in members:
+                z.add_file(full, rel)
+                log(f"  + {rel}", "DEBUG")
+        JOURNAL.count(files=len(z.central), bytes=os.path.getsize(output_path_abs))
+        PROFILE.add_io("zip", read=sum(e[7] for e in z.central),
+                       written=os.path.getsize(output_path_abs))
+
+    z.report()
+    if key:
+        store_artifact(cache_dir, key, output_path_abs)
+    size_mb = os.path.getsize(output_path_abs) / (1024 * 1024)
+    log(f"ZIP created: {output_path_abs} ({size_mb:.2f} MB)", "INFO")
+
+
+def create_zip_from_tree(treeish, output_path, whitelist, workers=1, policy=None,
+                         deterministic=False, cache_dir=None):
+    """
+    ZIP the whitelisted files of a committed tree without touching the
+    working tree: ls-tree lists them, one cat-file --batch streams the
+    blobs into the writer. Every member gets the commit time of treeish
+    and its git file mode, so the archive matches what was pushed.
+    """
+    output_path_abs = os.path.abspath(output_path)
+    log(f"Creating ZIP  : {output_path_abs}", "DEBUG")
+    log(f"  Source      : git tree {treeish}", "DEBUG")
+    log(f"  Whitelist   : {whitelist}", "DEBUG")
+    log(f"  Workers     : {workers}", "DEBUG")
+
+    entries = filtered_tree_entries(treeish, whitelist)
+    if not entries:
+        log(f"Nothing to archive from {treeish}.", "ERROR")
+        sys.exit(1)
+    ok, ctime = GIT.query(["git", "log", "-1", "--format=%ct", treeish])
+    mtime     = int(ctime) if ok and ctime.isdigit() else None
+
+    # Submodules (gitlinks) have no blob to archive; git stores symlinks
+    # as 120000, archives carry them as lrwxrwxrwx
+    blobs = [(int(mode, 8) | (0o777 if mode == "120000" else 0), sha, path)
+             for mode, otype, sha, _, path in entries if otype == "blob"]
+    if deterministic:
+        blobs.sort(key=lambda b: b[2])
+
+    with JOURNAL.span("zip", archive=os.path.basename(output_path_abs), source=treeish):
+        key = None
+        if cache_dir is not None:
+            key = artifact_key(blobs, policy)
+            if fetch_artifact(cache_dir, key, output_path_abs):
+                JOURNAL.count(files=len(blobs), bytes=os.path.getsize(output_path_abs), cached=1)
+                return
+
+        try:
+            with ParallelZipWriter(output_path_abs, workers=workers, policy=policy,
+                                   deterministic=deterministic) as z:
+                for (mode, _, path), (_, data) in zip(blobs, GIT.iter_blobs([b[1] for b in blobs])):
+                    z.add_bytes(data, path, mtime=mtime, mode=mode)
+        except RuntimeError as e:
+            log(str(e), "ERROR")
+            sys.exit(1)
+        JOURNAL.count(files=len(z.central), bytes=os.path.getsize(output_path_abs))
+        PROFILE.add_io("zip", read=sum(e[7] for e in z.central),
+                       written=os.path.getsize(output_path_abs))
+
+    z.report()
+    if key:
+        store_artifact(cache_dir, key, output_path_abs)
+    size_mb = os.path.getsize(output_path_abs) / (1024 * 1024)
+    log(f"ZIP created: {output_path_abs} ({size_mb:.2f} MB, {len(blobs)} files from {treeish})", "INFO")
+
+
+def zip_source(cfg):
+    """Return validated ZipSource (worktree | git)."""
+    source = cfgget(cfg, "ZipSource", "worktree").strip().lower()
+    if source not in ZIP_SOURCES:
+        log(f"Invalid ZipSource '{source}'. Use one of: {', '.join(ZIP_SOURCES)}", "ERROR")
+        sys.exit(1)
+    return source
+
+
+# ==============================================================================
+# ARTIFACT CACHE
+# <ArtifactCacheDir>/<key[:2]>/<key>.zip, key = sha256 over the compression
+# policy and the sorted (mode, blob sha, name) of every member. Worktree
+# files are hashed with git hash-object, so the same content gives the same
+# key whether it is zipped from disk or from git objects.
+# ==============================================================================
+ARTIFACT_FORMAT = "sync-zip-1"
+
+
+def artifact_cache(cfg):
+    """ArtifactCacheDir as absolute path, or None when caching is off."""
+    raw = cfgget(cfg, "ArtifactCacheDir", "").strip()
+    if not raw:
+        return None
+    if cfgget(cfg, "DeterministicZip", "false").lower() != "true":
+        log("ArtifactCacheDir ignored: requires DeterministicZip=true.", "DEBUG")
+        return None
+    return os.path.normpath(os.path.join(SCRIPT_DIR, raw))
+
+
+def worktree_listing(members):
+    """(mode, blob sha, arcname) for (full path, arcname) members, one hash-object."""
+    if not members:
+        return []
+    # realpath: add_file() archives the target's content, not the link
+    ok, out = run_ok(["git", "hash-object", "--no-filters", "--stdin-paths"],
+                     input_text="".join(os.path.realpath(full) + "\n" for full, _ in members))
+    shas = out.split()
+    if not ok or len(shas) != len(members):
+        log("git hash-object failed, artifact cache skipped.", "DEBUG")
+        return None
+    return [(os.stat(full).st_mode, sha, rel) for (full, rel), sha in zip(members, shas)]
+
+
+def artifact_key(listing, policy):
+    import hashlib
+    policy = policy or ZipPolicy()
+    h = hashlib.sha256(f"{ARTIFACT_FORMAT} {policy.method} {policy.level} "
+                       f"{','.join(sorted(policy.store_ext))}\n".encode("utf-8"))
+    for mode, sha, name in sorted(listing, key=lambda e: e[2]):
+        h.update(f"{zip_normalized_mode(mode):o} {sha} {name}\0".encode("utf-8"))
+    return h.hexdigest()
+
+
+def artifact_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], key + ".zip")
+
+
+def fetch_artifact(cache_dir, key, output_path):
+    """Place the cached ZIP for key at output_path (hardlink, else copy)."""
+    import shutil
+    cached = artifact_path(cache_dir, key)
+    if not os.path.exists(cached):
+        log(f"Artifact cache miss: {key[:12]}", "DEBUG")
+        return False
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    try:
+        os.link(cached, output_path)
+    except OSError:
+        shutil.copyfile(cached, output_path)
+    size_mb = os.path.getsize(output_path) / (1024 * 1024)
+    log(f"ZIP reused from artifact cache ({key[:12]}): {output_path} ({size_mb:.2f} MB)", "INFO")
+    return True
+
+
+def store_artifact(cache_dir, key, output_path):
+    import shutil
+    cached = artifact_path(cache_dir, key)
+    tmp    = f"{cached}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        shutil.copyfile(output_path, tmp)
+        os.replace(tmp, cached)
+        log(f"Stored in artifact cache: {key[:12]}", "DEBUG")
+    except OSError as e:
+        log(f"Artifact cache write failed: {e}", "DEBUG")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# ==============================================================================
+# BACKUP NAMING
+# ==============================================================================
+def backup_name(cfg, btype, version, remote=None, branch=None):
+    fmt = cfgget(cfg, "BackupFormat",
+                 "{date}_{time}_{type}_{project}_v{version}_{remote}_{branch}.zip")
+    
+    # If branch not provided, use ACTUAL current branch
+    if branch is None:
+        branch = current_branch()
+    
+    return fmt.format(
+        date    = datetime.now().strftime("%Y-%m-%d"),
+        time    = datetime.now().strftime("%H%M%S"),
+        type    = btype,
+        project = cfgget(cfg, "RemoteProjectName", "PROJECT"),
+        version = version,
+        remote  = remote or "LOCAL",
+        branch  = branch,
+    )
+
+
+# ==============================================================================
+# GIT HELPERS
+# Commands run as argument lists (no shell). Ref/object lookups go through one
+# long-lived "git cat-file --batch-check" process and are cached for the run;
+# the cache is dropped whenever a command that can move refs is executed.
+# Remote branch heads come from a single "git ls-remote --heads" per remote
+# and are kept up to date by our own pushes. The working tree status is one
+# "git status --porcelain=v2" snapshot (STATUS), dropped whenever we run a
+# git command or a file write that can change it.
+# ==============================================================================
+# git subcommands that never change index, working tree or HEAD
+# (do not invalidate the status snapshot)
+GIT_STATUS_SAFE = {
+    "cat-file", "check-ignore", "commit-tree", "count-objects", "describe",
+    "diff", "diff-tree", "for-each-ref", "hash-object", "log", "ls-files",
+    "ls-remote", "ls-tree", "merge-base", "mktree", "rev-list", "rev-parse",
+    "show", "status", "write-tree",
+}
+# git subcommands that never move refs (do not invalidate the ref cache):
+# all of the above plus the index-only plumbing
+GIT_REF_SAFE = GIT_STATUS_SAFE | {"checkout-index", "read-tree", "update-index"}
+# extra "-c key=value" options for every git command (UseFsMonitor)
+GIT_RUN_CONFIG = []
+
+
+def fmt_cmd(cmd):
+    return " ".join(f'"{a}"' if not a or " " in a else a for a in cmd)
+
+
+def git_subcommand(cmd):
+    """Subcommand of a git argv, skipping global options like -c key=val."""
+    i = 1
+    while i < len(cmd) and cmd[i].startswith("-"):
+        i += 2 if cmd[i] in ("-c", "-C") else 1
+    return cmd[i] if i < len(cmd) else ""
+
+
+def git_changes_status(cmd, env=None):
+    """True if a git argv can change what "git status" reports."""
+    subcommand = git_subcommand(cmd)
+    args       = cmd[cmd.index(subcommand) + 1:] if subcommand in cmd else []
+    if subcommand in GIT_STATUS_SAFE:
+        return False
+    if subcommand == "branch" and not any(a.startswith("-") for a in args):
+        return False  # creates a ref, HEAD/index/tree untouched
+    if subcommand in ("read-tree", "update-index") and env and "GIT_INDEX_FILE" in env:
+        return "-u" in args  # private index; -u also writes the working tree
+    return True
+
+
+def exec_cmd(cmd, input_text=None, env=None):
+    """
+    Run argv without a shell. Missing executables report rc=127.
+    Output is UTF-8; raw (non UTF-8) path bytes in it, and in input_text,
+    round-trip through surrogateescape (log() prints them as U+FFFD).
+    """
+    moves_refs = changes_status = False
+    if cmd and cmd[0] == "git":
+        moves_refs     = git_subcommand(cmd) not in GIT_REF_SAFE
+        changes_status = git_changes_status(cmd, env)
+        cmd = ["git", *GIT_RUN_CONFIG, *cmd[1:]]
+    start = time.perf_counter()
+    try:
+        res = subprocess.run(cmd, text=True, encoding="utf-8", errors="surrogateescape",
+                             capture_output=True, cwd=SCRIPT_DIR, input=input_text, env=env)
+    except OSError as e:
+        res = subprocess.CompletedProcess(cmd, 127, "", str(e))
+    elapsed = time.perf_counter() - start
+    # drop caches once the command is done: a lookup from another thread
+    # while it ran may have cached the old state
+    if moves_refs:
+        GIT.invalidate()
+    if changes_status:
+        STATUS.invalidate()
+    JOURNAL.event("exec", cmd=cmd, rc=res.returncode, duration=round(elapsed, 4))
+    PROFILE.record_exec(cmd, elapsed)
+    return res
+
+
+def run(cmd, abort_on_error=True, input_text=None, env=None):
+    log(f"EXEC: {fmt_cmd(cmd)}", "DEBUG")
+    res = exec_cmd(cmd, input_text=input_text, env=env)
+    if res.stdout.strip():
+        log(res.stdout.strip(), "DEBUG")
+    if res.stderr.strip():
+        log(res.stderr.strip(), "DEBUG")
+    if res.returncode != 0:
+        log(f"Command failed (rc={res.returncode}).", "ERROR")
+        if abort_on_error:
+            sys.exit(1)
+    return res.stdout.strip()
+
+
+def run_ok(cmd, input_text=None, env=None):
+    res = exec_cmd(cmd, input_text=input_text, env=env)
+    return res.returncode == 0, res.stdout.strip()
+
+
+def run_z(cmd, input_text=None, env=None):
+    """
+    run_ok() for NUL-separated (-z) output: returns (ok, records). Paths
+    are raw bytes decoded with surrogateescape (round-trip through os.* and
+    back into git) and never stripped.
+    """
+    res     = exec_cmd(cmd, input_text=input_text, env=env)
+    records = res.stdout.split("\0")
+    if records[-1] == "":
+        records.pop()
+    return res.returncode == 0, records
+
+
+class GitBackend:
+    """
+    Long-lived "git cat-file --batch-check" for ref and object lookups,
+    with a per-run cache. invalidate() drops the cache and the process
+    (it is restarted lazily on the next lookup). Thread-safe: --release
+    tasks share it.
+    """
+
+    def __init__(self):
+        self.proc  = None
+        self.cache = {}
+        self.lock  = threading.RLock()
+
+    def invalidate(self):
+        with self.lock:
+            self.cache.clear()
+            self.close()
+
+    def close(self):
+        with self.lock:
+            if self.proc is not None:
+                try:
+                    self.proc.stdin.close()
+                    self.proc.wait(timeout=5)
+                except Exception:
+                    self.proc.kill()
+                self.proc.stdout.close()
+                self.proc = None
+
+    def batch_check(self, rev):
+        """Return (sha, type, size) for rev, or None if it does not resolve."""
+        key = ("object", rev)
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+            if self.proc is None:
+                log("EXEC: git cat-file --batch-check (persistent)", "DEBUG")
+                JOURNAL.event("exec", cmd=["git", "cat-file", "--batch-check"], persistent=True)
+                PROFILE.record_exec(["git", "cat-file", "--batch-check"], 0.0)
+                self.proc = subprocess.Popen(["git", "cat-file", "--batch-check"],
+                                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                             stderr=subprocess.DEVNULL, cwd=SCRIPT_DIR)
+            self.proc.stdin.write(rev.encode("utf-8") + b"\n")
+            self.proc.stdin.flush()
+            parts  = self.proc.stdout.readline().decode("utf-8").split()
+            result = (parts[0], parts[1], int(parts[2])) if len(parts) == 3 else None
+            self.cache[key] = result
+            return result
+
+    def iter_blobs(self, shas):
+        """
+        Yield (sha, bytes) for every sha from one "git cat-file --batch".
+        Requests are fed from a thread, so the pipes never deadlock.
+        Raises RuntimeError if an object is missing.
+        """
+        cmd = ["git", "cat-file", "--batch"]
+        log(f"EXEC: {fmt_cmd(cmd)} ({len(shas)} objects)", "DEBUG")
+        start = time.perf_counter()
+        proc  = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL, cwd=SCRIPT_DIR)
+
+        def feed():
+            try:
+                for sha in shas:
+                    proc.stdin.write(sha.encode("ascii") + b"\n")
+                proc.stdin.close()
+            except OSError:
+                pass
+
+        feeder = threading.Thread(target=feed, name="cat-file-feed", daemon=True)
+        feeder.start()
+        try:
+            for sha in shas:
+                header = proc.stdout.readline().split()
+                if len(header) != 3:
+                    raise RuntimeError(f"git cat-file --batch: object {sha} is missing")
+                data = proc.stdout.read(int(header[2]))
+                proc.stdout.read(1)  # LF after content
+                yield sha, data
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+            feeder.join(timeout=5)
+            elapsed = time.perf_counter() - start
+            JOURNAL.event("exec", cmd=cmd, objects=len(shas), duration=round(elapsed, 4))
+            PROFILE.record_exec(cmd, elapsed)
+
+    def query(self, cmd):
+        """Cached run_ok() for read-only git queries."""
+        key = ("query", tuple(cmd))
+        with self.lock:
+            if key not in self.cache:
+                self.cache[key] = run_ok(cmd)
+            return self.cache[key]
+
+
+GIT = GitBackend()
+atexit.register(GIT.close)
+
+
+class RemoteRefs:
+    """
+    Per-run cache of remote branch heads. The first lookup for a remote
+    lists all its branches with one "git ls-remote --heads" round-trip;
+    later checks are answered from memory. Local fetches do not change the
+    remote, so only our own pushes update the cache (pushed()). A failed
+    listing aborts the run instead of caching an empty remote.
+    """
+
+    def __init__(self):
+        self.heads = {}
+        self.lock  = threading.Lock()
+
+    def head(self, remote, branch):
+        """Advertised sha of remote/branch, or None if it does not exist."""
+        with self.lock:
+            if remote not in self.heads:
+                res = exec_cmd(["git", "ls-remote", "--heads", remote])
+                if res.returncode != 0:
+                    # an unreachable remote must not read as "branch missing"
+                    log(f"Cannot list branches of remote '{remote}' (rc={res.returncode}).", "ERROR")
+                    if res.stderr.strip():
+                        log(res.stderr.strip(), "ERROR")
+                    sys.exit(1)
+                heads = {}
+                for line in res.stdout.splitlines():
+                    sha, _, ref = line.partition("\t")
+                    if ref.startswith("refs/heads/"):
+                        heads[ref[len("refs/heads/"):]] = sha
+                self.heads[remote] = heads
+                log(f"Remote {remote}: {len(heads)} branch(es) listed.", "DEBUG")
+            return self.heads[remote].get(branch)
+
+    def pushed(self, remote, branch):
+        """Record that the local branch was just pushed to remote/branch."""
+        with self.lock:
+            if remote not in self.heads:
+                return          # never listed: nothing cached, no lookup needed
+            obj = GIT.batch_check(f"refs/heads/{branch}")
+            if obj:
+                self.heads[remote][branch] = obj[0]
+
+
+REMOTE_REFS = RemoteRefs()
+
+
+class RepoStatus:
+    """
+    Parsed "git status --porcelain=v2 -z --branch", taken once and shared
+    until invalidate() (called by exec_cmd and our own file writes).
+      head     current branch ("HEAD" if detached, like current_branch())
+      oid      HEAD commit (None before the first commit)
+      entries  [(XY, path)] of changed paths; "??" = untracked
+    -z paths are raw bytes: they are decoded with surrogateescape (use
+    display_path() for logging).
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.lock     = threading.RLock()
+
+    def invalidate(self):
+        with self.lock:
+            self.snapshot = None
+
+    def get(self):
+        with self.lock:
+            if self.snapshot is None:
+                self.snapshot = self.scan()
+            return self.snapshot
+
+    @staticmethod
+    def scan():
+        ok, records = run_z(["git", "status", "--porcelain=v2", "-z", "--branch"])
+        if not ok:
+            log("git status failed.", "ERROR")
+            sys.exit(1)
+        status  = {"head": None, "oid": None, "entries": []}
+        records = iter(records)
+        for record in records:
+            if record.startswith("# branch.head "):
+                head = record[len("# branch.head "):]
+                status["head"] = "HEAD" if head == "(detached)" else head
+            elif record.startswith("# branch.oid "):
+                oid = record[len("# branch.oid "):]
+                status["oid"] = None if oid == "(initial)" else oid
+            elif record.startswith("? "):
+                status["entries"].append(("??", record[2:]))
+            elif record[:2] in ("1 ", "u "):
+                fields = record.split(" ", 8 if record[0] == "1" else 10)
+                status["entries"].append((fields[1], fields[-1]))
+            elif record.startswith("2 "):
+                fields = record.split(" ", 9)
+                status["entries"].append((fields[1], fields[-1]))
+                next(records, None)  # rename/copy source path
+        return status
+
+    @property
+    def dirty(self):
+        return bool(self.get()["entries"])
+
+    @property
+    def head(self):
+        return self.get()["head"]
+
+    @property
+    def oid(self):
+        return self.get()["oid"]
+
+    def summary(self):
+        entries = self.get()["entries"]
+        if not entries:
+            return "[CLEAN]"
+        untracked = sum(1 for xy, _ in entries if xy == "??")
+        return f"{len(entries) - untracked} changed, {untracked} untracked"
+
+
+STATUS = RepoStatus()
+
+
+def display_path(path):
+    """Printable form of a surrogateescape-decoded path."""
+    return path.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
+
+
+def use_fsmonitor(cfg):
+    """UseFsMonitor=true: run every git command with fsmonitor + untracked cache."""
+    if cfgget(cfg, "UseFsMonitor", "false").strip().lower() == "true":
+        GIT_RUN_CONFIG[:] = ["-c", "core.fsmonitor=true", "-c", "core.untrackedCache=true"]
+        log("git runs with core.fsmonitor + core.untrackedCache.", "DEBUG")
+
+
+def is_dirty():
+    return STATUS.dirty
+
+
+def current_branch():
+    ok, out = GIT.query(["git", "rev-parse", "--abbrev-ref", "HEAD"])
+    if not ok:
+        log("Cannot determine current branch.", "ERROR")
+        sys.exit(1)
+    return out
+
+
+def branch_exists_local(branch):
+    return GIT.batch_check(branch) is not None
+
+
+def branch_exists_remote(remote, branch):
+    return REMOTE_REFS.head(remote, branch) is not None
+
+
+def fetch_remote_branch(remote, branch):
+    """
+    git fetch remote branch, skipped when refs/remotes/remote/branch already
+    points at the head advertised by the remote.
+    """
+    head     = REMOTE_REFS.head(remote, branch)
+    tracking = GIT.batch_check(f"refs/remotes/{remote}/{branch}")
+    if head and tracking and tracking[0] == head:
+        log(f"{remote}/{branch} already at {head[:12]} - fetch skipped.", "DEBUG")
+        return
+    with JOURNAL.span("fetch", branch=branch):
+        run(["git", "fetch", remote, branch])
+
+
+def push_branch(remote, branch, force=False):
+    with JOURNAL.span("push", branch=branch, force=force):
+        run(["git", "push", *(["--force"] if force else []), remote, branch])
+    REMOTE_REFS.pushed(remote, branch)
+
+
+def get_current_commit():
+    """Get current HEAD commit hash."""
+    obj = GIT.batch_check("HEAD")
+    return obj[0] if obj else None
+
+
+# ==============================================================================
+# DEV SAFETY GUARD
+# ==============================================================================
+def git_index_path():
+    """Absolute path of the repository's real index file."""
+    ok, path = GIT.query(["git", "rev-parse", "--git-path", "index"])
+    return os.path.join(SCRIPT_DIR, path) if ok and path else None
+
+
+def create_safety_snapshot(head):
+    """
+    Capture index + working tree (incl. untracked) as a commit object,
+    stash-style, without touching the user's index or working tree:
+      snapshot        tree = working tree, parents = [HEAD, index commit]
+      snapshot^2      tree = index as staged by the user
+    Works on copies of the index (GIT_INDEX_FILE). Returns snapshot hash.
+    """
+    import shutil
+    import tempfile
+    tmp_dir    = tempfile.mkdtemp(prefix="sync-safety-")
+    index_file = os.path.join(tmp_dir, "index")
+    real_index = git_index_path()
+    try:
+        if real_index and os.path.exists(real_index):
+            shutil.copy2(real_index, index_file)
+        env         = index_env(index_file)
+        head_parent = ["-p", head] if head else []
+
+        index_tree   = run(["git", "write-tree"], env=env)
+        index_commit = run(["git", "commit-tree", index_tree, *head_parent,
+                            "-m", "SYNC SAFETY INDEX"])
+
+        run(["git", "add", "-A"], env=env)
+        work_tree = run(["git", "write-tree"], env=env)
+        snapshot  = run(["git", "commit-tree", work_tree, *head_parent, "-p", index_commit,
+                         "-m", "SYNC SAFETY SNAPSHOT"])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return snapshot
+
+
+def restore_safety_snapshot(snapshot):
+    """
+    Write snapshot files back to the working tree, remove the files that
+    were deleted in it (tracked at the snapshot's HEAD, missing from its
+    tree: staged and unstaged deletions) and restore the staged index.
+    """
+    import shutil
+    import tempfile
+    tmp_dir    = tempfile.mkdtemp(prefix="sync-safety-")
+    index_file = os.path.join(tmp_dir, "index")
+    try:
+        env = index_env(index_file)
+        run(["git", "read-tree", snapshot], env=env)
+        run(["git", "checkout-index", "-a", "-f"], env=env)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    deleted = []
+    if GIT.batch_check(f"{snapshot}^1"):
+        ok, deleted = run_z(["git", "diff-tree", "-r", "-z", "--name-only", "--no-renames",
+                             "--diff-filter=D", f"{snapshot}^1", snapshot])
+        if not ok:
+            log("git diff-tree failed, deleted files not removed.", "ERROR")
+            deleted = []
+    for rel in deleted:
+        full = os.path.join(SCRIPT_DIR, *rel.split("/"))
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(full)
+        log(f"  removed (deleted in snapshot): {rel}", "DEBUG")
+        # drop directories the deletion left empty, like git does
+        parent = os.path.dirname(full)
+        while parent != SCRIPT_DIR and parent.startswith(SCRIPT_DIR):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+    run(["git", "read-tree", f"{snapshot}^2"])
+    run(["git", "update-index", "-q", "--refresh"], abort_on_error=False)
+
+
+class DevSafetyGuard:
+    """
+    Creates a safety branch before operations, restores dev state on exit.
+    Dirty state is captured as a snapshot commit object (see
+    create_safety_snapshot); the user's index and working tree are untouched.
+    """
+    
+    def __init__(self, operation, cfg=None):
+        self.operation       = operation
+        self.cfg             = cfg
+        self.original_branch = None
+        self.was_dirty       = False
+        self.safety_branch   = None
+        self.initial_commit  = None
+        self.snapshot        = None
+        
+    def __enter__(self):
+        with JOURNAL.span("safety_guard", step="enter", operation=self.operation):
+            # branch, dirty state and HEAD from one status scan
+            self.original_branch = STATUS.head
+            self.was_dirty       = STATUS.dirty
+            self.initial_commit  = STATUS.oid
+            self.safety_branch   = f"sync-safety-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        
+            log(f"Creating safety branch: {self.safety_branch}", "INFO")
+        
+            if self.was_dirty:
+                log("Capturing index + working tree into safety snapshot...", "DEBUG")
+                self.snapshot = create_safety_snapshot(self.initial_commit)
+                run(["git", "branch", self.safety_branch, self.snapshot])
+                log(f"Safety snapshot: {self.snapshot} (index and working tree untouched).", "DEBUG")
+            else:
+                run(["git", "branch", self.safety_branch])
+                log("Safety branch created (clean state).", "DEBUG")
+            
+            return self
+        
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with JOURNAL.span("safety_guard", step="exit", operation=self.operation):
+            current = STATUS.head
+            if current != self.original_branch:
+                log(f"Returning to {self.original_branch}...", "DEBUG")
+                run(["git", "checkout", self.original_branch], abort_on_error=False)
+            
+            now_dirty = STATUS.dirty
+            current_commit = STATUS.oid
+            commits_made = current_commit != self.initial_commit
+        
+            if self.was_dirty and not now_dirty and not commits_made:
+                log("", "ERROR")
+                log("=" * 70, "ERROR")
+                log("  CRITICAL: Dev working tree state was lost!", "ERROR")
+                log("  Restoring from safety branch...", "ERROR")
+                log("=" * 70, "ERROR")
+                restore_safety_snapshot(self.snapshot)
+                log("Dev state restored from safety branch.", "INFO")
+            elif commits_made:
+                log(f"Dev state: commits made during operation (expected).", "DEBUG")
+            elif self.was_dirty and now_dirty:
+                log(f"Dev state: dirty (preserved).", "DEBUG")
+            else:
+                log(f"Dev state: clean (preserved).", "DEBUG")
+        
+            log("", "INFO")
+            log(f"Safety branch: {self.safety_branch}", "INFO")
+            log("Contains complete snapshot of dev before sync operation.", "INFO")
+            log(f"To delete: git branch -D {self.safety_branch}", "INFO")
+            log("", "INFO")
+
+            if self.cfg is not None:
+                prune_safety_branches(self.cfg, keep=(self.safety_branch,))
+
+        return False
+
+
+# ==============================================================================
+# SAFETY REF RETENTION
+# Safety branches older than the retention window are moved to the
+# refs/sync-safety/ namespace (packed, hidden from "git branch" and default
+# fetch/push refspecs) or deleted, in one "git update-ref --stdin" call.
+# ==============================================================================
+SAFETY_PREFIX        = "sync-safety-"
+SAFETY_ARCHIVE_NS    = "refs/sync-safety/"
+SAFETY_PRUNE_MODES   = ("archive", "delete", "off")
+
+
+def safety_retention(cfg):
+    """Return (keep_last, keep_days, mode, archive_days) from config."""
+    try:
+        keep_last = max(int(cfgget(cfg, "SafetyKeepLast", "20")), 0)
+        keep_days = max(int(cfgget(cfg, "SafetyKeepDays", "30")), 0)
+    except ValueError:
+        log("Invalid SafetyKeepLast/SafetyKeepDays, using 20 / 30.", "ERROR")
+        keep_last, keep_days = 20, 30
+    try:
+        archive_days = max(int(cfgget(cfg, "SafetyArchiveKeepDays", "180")), 0)
+    except ValueError:
+        log("Invalid SafetyArchiveKeepDays, using 180.", "ERROR")
+        archive_days = 180
+    mode = cfgget(cfg, "SafetyPruneMode", "archive").strip().lower()
+    if mode not in SAFETY_PRUNE_MODES:
+        log(f"Invalid SafetyPruneMode '{mode}'. Use one of: {', '.join(SAFETY_PRUNE_MODES)}", "ERROR")
+        mode = "off"
+    return keep_last, keep_days, mode, archive_days
+
+
+def git_common_dir():
+    ok, path = GIT.query(["git", "rev-parse", "--git-common-dir"])
+    return os.path.join(SCRIPT_DIR, path) if ok and path else None
+
+
+def ref_storage_stats():
+    """(ref count, loose ref files, loose ref bytes, packed-refs bytes)."""
+    git_dir = git_common_dir()
+    _, out  = run_ok(["git", "for-each-ref", "--format=%(refname)"])
+    loose_files = loose_bytes = packed_bytes = 0
+    if git_dir:
+        for root, _, files in os.walk(os.path.join(git_dir, "refs")):
+            for filename in files:
+                loose_files += 1
+                loose_bytes += os.path.getsize(os.path.join(root, filename))
+        packed = os.path.join(git_dir, "packed-refs")
+        if os.path.exists(packed):
+            packed_bytes = os.path.getsize(packed)
+    return len(out.splitlines()), loose_files, loose_bytes, packed_bytes
+
+
+def expired_safety_refs(namespace, keep_last, keep_days, keep=()):
+    """
+    Safety refs under namespace (refs/heads/ or SAFETY_ARCHIVE_NS) outside
+    the retention window, oldest first: [(name, sha)], name without namespace.
+    """
+    _, out = run_ok(["git", "for-each-ref", "--format=%(refname) %(objectname)",
+                     f"{namespace}{SAFETY_PREFIX}*"])
+    branches = []
+    for line in out.splitlines():
+        refname, sha = line.split(" ", 1)
+        name = refname[len(namespace):]
+        try:
+            created = datetime.strptime(name[len(SAFETY_PREFIX):], "%Y%m%d-%H%M%S")
+        except ValueError:
+            continue  # not created by this tool, never touch it
+        branches.append((created, name, sha))
+    branches.sort()
+
+    cutoff  = datetime.now() - timedelta(days=keep_days)
+    recent  = {name for _, name, _ in branches[-keep_last:]} if keep_last else set()
+    expired = [(name, sha) for created, name, sha in branches
+               if created < cutoff and name not in recent and name not in keep]
+    return expired
+
+
+def prune_safety_branches(cfg, keep=(), force_mode=None):
+    """
+    Apply the safety retention policy. Returns number of refs pruned
+    (expired branches plus archived refs past SafetyArchiveKeepDays).
+    keep: branch names that must survive (e.g. the one just created).
+    """
+    keep_last, keep_days, mode, archive_days = safety_retention(cfg)
+    mode = force_mode or mode
+    if mode == "off":
+        return 0
+
+    expired  = expired_safety_refs("refs/heads/", keep_last, keep_days, keep)
+    archived = expired_safety_refs(SAFETY_ARCHIVE_NS, 0, archive_days) if archive_days else []
+    if not expired and not archived:
+        log("Safety branches: nothing to prune.", "DEBUG")
+        return 0
+
+    commands = []
+    for name, sha in expired:
+        if mode == "archive":
+            commands.append(f"create {SAFETY_ARCHIVE_NS}{name} {sha}\n")
+        commands.append(f"delete refs/heads/{name} {sha}\n")
+        log(f"  {'ARCHIVED' if mode == 'archive' else 'DELETED'}: {name}", "DEBUG")
+    for name, sha in archived:
+        commands.append(f"delete {SAFETY_ARCHIVE_NS}{name} {sha}\n")
+        log(f"  DELETED: {SAFETY_ARCHIVE_NS}{name}", "DEBUG")
+    run(["git", "update-ref", "--stdin"], input_text="".join(commands))
+    run(["git", "pack-refs", "--all", "--prune"])
+
+    if expired:
+        verb = "archived to " + SAFETY_ARCHIVE_NS if mode == "archive" else "deleted"
+        log(f"Safety branches: {len(expired)} expired, {verb} "
+            f"(keep last {keep_last} / newer than {keep_days} days).", "INFO")
+    if archived:
+        log(f"Archived safety refs: {len(archived)} older than {archive_days} days deleted.", "INFO")
+    return len(expired) + len(archived)
+
+
+# ==============================================================================
+# GITHUB CLI CHECK
+# ==============================================================================
+def require_gh():
+    ok, _ = run_ok(["gh", "--version"])
+    if not ok:
+        log("", "ERROR")
+        log("===================================================================", "ERROR")
+        log("  GitHub CLI (gh) is NOT installed or not found in PATH.", "ERROR")
+        log("", "ERROR")
+        log("  GitHub CLI is required for --release and --deploy.", "ERROR")
+        log("  Download: https://cli.github.com/", "ERROR")
+        log("  After install: gh auth login", "ERROR")
+        log("===================================================================", "ERROR")
+        sys.exit(1)
+    log("GitHub CLI (gh) found.", "DEBUG")
+
+
+# ==============================================================================
+# CHANGELOG
+# ==============================================================================
+# Commit prefix (COMMIT_CONVENTIONS) -> section title; "other" catches the rest
+CHANGELOG_GROUPS = (
+    ("feat",  "Features"),
+    ("fix",   "Fixes"),
+    ("perf",  "Performance"),
+    ("refac", "Refactoring"),
+    ("docs",  "Documentation"),
+    ("chore", "Chores"),
+    ("other", "Other"),
+)
+# groups left out of the public changelog (still listed in the dev one)
+CHANGELOG_DEV_ONLY = {"chore"}
+CHANGELOG_PREFIX   = re.compile(r"^(\w+)(?:\([^)]*\))?!?:\s*(.+)$")
+CHANGELOG_STATE    = "sync-changelog.json"
+# our own metadata commits (cmd_update) never show up in the changelog
+CHANGELOG_SKIP     = re.compile(r"^\[[^\]]*\] \| readme \+ changelog update$")
+
+
+def changelog_state_path():
+    """Per-branch "last processed commit" file inside the git dir."""
+    ok, path = GIT.query(["git", "rev-parse", "--git-path", CHANGELOG_STATE])
+    return os.path.join(SCRIPT_DIR, path) if ok and path else None
+
+
+def load_changelog_state():
+    path = changelog_state_path()
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_changelog_state(state):
+    path = changelog_state_path()
+    if not path:
+        return
+    write_if_changed(path, json.dumps(state, indent=1))
+
+
+def changelog_range(last_commit):
+    """
+    git log arguments for the commits to process: everything after the last
+    processed commit if it is still an ancestor of HEAD, else everything
+    since the last tag, else the last 30 commits.
+    """
+    if last_commit and GIT.batch_check(last_commit):
+        ok, _ = run_ok(["git", "merge-base", "--is-ancestor", last_commit, "HEAD"])
+        if ok:
+            return [f"{last_commit}..HEAD"]
+        log(f"Changelog: {last_commit[:12]} is no longer an ancestor of HEAD.", "DEBUG")
+    ok, last_tag = run_ok(["git", "describe", "--tags", "--abbrev=0"])
+    if ok and last_tag:
+        return [f"{last_tag}..HEAD"]
+    return ["-30", "HEAD"]
+
+
+def iter_commits(rev_args):
+    """
+    Stream (sha, subject) of non-merge commits, newest first, from one
+    "git log -z" process; records are read as they arrive. Raises
+    CalledProcessError at the end of the stream if git log failed (the
+    commits seen so far may be incomplete).
+    """
+    cmd = ["git", "log", "-z", "--no-merges", "--format=%H%x1f%s", *rev_args]
+    log(f"EXEC: {fmt_cmd(cmd)}", "DEBUG")
+    start = time.perf_counter()
+    proc  = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=SCRIPT_DIR)
+    count = 0
+    try:
+        pending = b""
+        for chunk in iter(lambda: proc.stdout.read(ZIP_CHUNK), b""):
+            *records, pending = (pending + chunk).split(b"\0")
+            for record in records:
+                sha, _, subject = record.decode("utf-8", "replace").strip("\n").partition("\x1f")
+                count += 1
+                yield sha, subject
+        if pending.strip():
+            sha, _, subject = pending.decode("utf-8", "replace").strip("\n").partition("\x1f")
+            count += 1
+            yield sha, subject
+        stderr = proc.stderr.read().decode("utf-8", "replace").strip()
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+    finally:
+        proc.stdout.close()
+        proc.stderr.close()
+        if proc.poll() is None:
+            proc.kill()
+        rc      = proc.wait()
+        elapsed = time.perf_counter() - start
+        JOURNAL.event("exec", cmd=cmd, rc=rc, commits=count, duration=round(elapsed, 4))
+        PROFILE.record_exec(cmd, elapsed)
+
+
+def group_commits(commits):
+    """{group: [(sha, text), ...]} by COMMIT_CONVENTIONS prefix."""
+    known  = {key for key, _ in CHANGELOG_GROUPS}
+    groups = {}
+    for sha, subject in commits:
+        if CHANGELOG_SKIP.match(subject):
+            continue
+        m = CHANGELOG_PREFIX.match(subject)
+        if m and m.group(1).lower() in known:
+            key, text = m.group(1).lower(), m.group(2)
+        else:
+            key, text = "other", subject
+        groups.setdefault(key, []).append((sha, text))
+    return groups
+
+
+def changelog_items(groups, dev):
+    """{section title: [bullet lines]} for the public or the dev changelog."""
+    items = {}
+    for key, title in CHANGELOG_GROUPS:
+        if key not in groups or (key in CHANGELOG_DEV_ONLY and not dev):
+            continue
+        items[title] = [f"- {sha[:8]} {text}" if dev else f"- {text}"
+                        for sha, text in groups[key]]
+    return items
+
+
+def parse_changelog_section(lines):
+    """{section title: [bullet lines]} of an existing version section."""
+    items, title = {}, "Other"
+    for line in lines:
+        if line.startswith("### "):
+            title = line[4:].strip()
+        elif line.startswith("- "):
+            items.setdefault(title, []).append(line.rstrip("\r\n"))
+    return items
+
+
+def render_changelog_section(version, items, date=None):
+    titles = [t for _, t in CHANGELOG_GROUPS] + sorted(set(items) - {t for _, t in CHANGELOG_GROUPS})
+    out    = f"## [{version}] - {date or datetime.now().strftime('%Y-%m-%d')}\n\n"
+    for title in titles:
+        if items.get(title):
+            out += f"### {title}\n" + "\n".join(items[title]) + "\n\n"
+    return out
+
+
+def insert_changelog_section(path, version, items):
+    """
+    Put a version section at the top of path (below the title lines).
+    Sections are always added on top, so only the title and the newest
+    section are parsed: if that section is already [version] the new items
+    are merged into it (keeping its date). Everything after it is copied
+    through unchanged in ZIP_CHUNK blocks, never read line by line.
+    The file's own newline style is kept. Returns True if it was written.
+    """
+    import shutil
+    header  = f"## [{version}]".encode("utf-8")
+    head    = []
+    top     = []      # newest section, only if it is [version]
+    rest    = b""     # first line after head/top, rest follows from src
+    newline = "\n"
+    src     = open(path, "rb") if os.path.exists(path) else None
+    try:
+        if src is not None:
+            for line in iter(src.readline, b""):
+                if not head and not top and line.endswith(b"\r\n"):
+                    newline = "\r\n"
+                if line.startswith(b"## "):
+                    if top or not line.startswith(header):
+                        rest = line
+                        break
+                if top or line.startswith(b"## "):
+                    top.append(line)
+                else:
+                    head.append(line)
+
+        if top:
+            section = [l.decode("utf-8", "replace") for l in top]
+            m       = re.match(r"## \[[^\]]*\] - (\S+)", section[0])
+            merged  = parse_changelog_section(section)
+            added   = 0
+            for title, lines in items.items():
+                new = [l for l in lines if l not in merged.get(title, [])]
+                merged.setdefault(title, []).extend(new)
+                added += len(new)
+            if not added:
+                log(f"Changelog {path}: [{version}] already up to date.", "DEBUG")
+                return False
+            text = render_changelog_section(version, merged, m.group(1) if m else None)
+        else:
+            text = render_changelog_section(version, items)
+            if head and head[-1].strip():
+                text = ("\n" if head[-1].endswith(b"\n") else "\n\n") + text
+
+        with atomic_write(path, "wb") as dst:
+            dst.writelines(head)
+            dst.write(text.replace("\n", newline).encode("utf-8"))
+            dst.write(rest)
+            if src is not None:
+                shutil.copyfileobj(src, dst, ZIP_CHUNK)
+                src.close()  # before the replace (Windows cannot replace an open file)
+        return True
+    finally:
+        if src is not None:
+            src.close()
+
+
+def update_changelog(cfg, version):
+    """
+    Add the commits since the last processed one (per branch) to the public
+    changelog and the dev changelog, grouped by commit prefix.
+    """
+    path     = cfgget(cfg, "ChangelogPath", "CHANGELOG.md")
+    dev_path = cfgget(cfg, "DevChangelogPath", "CHANGELOG_DEV.md").strip()
+    branch   = current_branch()
+    head     = get_current_commit()
+    state    = load_changelog_state()
+
+    if not head or state.get(branch) == head:
+        log("No new commits found for changelog.", "DEBUG")
+        return
+
+    rev_args = changelog_range(state.get(branch))
+    try:
+        groups = group_commits(iter_commits(rev_args))
+    except subprocess.CalledProcessError as e:
+        # state stays at the last good commit; the next run retries the range
+        log(f"Changelog: git log {' '.join(rev_args)} failed (rc={e.returncode}): {e.stderr}", "ERROR")
+        return
+    if not groups:
+        log("No new commits found for changelog.", "DEBUG")
+    else:
+        log(f"Changelog: {sum(len(v) for v in groups.values())} new commits ({' '.join(rev_args)}).", "DEBUG")
+        public = changelog_items(groups, dev=False)
+        if public and insert_changelog_section(path, version, public):
+            log(f"Changelog updated: {path}", "INFO")
+        if dev_path and insert_changelog_section(dev_path, version, changelog_items(groups, dev=True)):
+            log(f"Dev changelog updated: {dev_path}", "INFO")
+
+    state[branch] = head
+    save_changelog_state(state)
+
+
+# ==============================================================================
+# COMMIT MESSAGE INPUT
+# ==============================================================================
+COMMIT_CONVENTIONS = """\
+  Commit conventions:
+    feat:   New feature
+    fix:    Bug fix
+    refac:  Code cleanup / refactor
+    perf:   Performance improvement
+    docs:   Documentation changes
+    chore:  Tooling / CI / build tasks
+
+  Example: feat: Add auto-changelog generation
+"""
+
+def ask_commit_msg(default_msg):
+    print(COMMIT_CONVENTIONS)
+    msg = input(f"  Commit message [{default_msg}]: ").strip()
+    if not msg:
+        msg = default_msg
+    return msg
+
+
+# ==============================================================================
+# CLEAN SLATE COPY
+# ==============================================================================
+def index_env(index_file):
+    """Environment that points git at a private index file."""
+    env = os.environ.copy()
+    env["GIT_INDEX_FILE"] = index_file
+    return env
+
+
+def filtered_tree_entries(treeish, whitelist, sizes=False):
+    """
+    Whitelisted blobs of treeish as (mode, type, sha, size, path) tuples.
+    One ls-tree limited to the whitelisted paths, so git never descends
+    into non-public trees. size is 0 unless sizes=True (ls-tree -l).
+    Returns None if treeish has no files under the whitelisted paths.
+    """
+    matcher   = compile_whitelist(whitelist)
+    long_fmt  = ["-l"] if sizes else []
+    ok, records = run_z(["git", "ls-tree", "-r", "-z", *long_fmt, "--full-tree", treeish, "--",
+                         *matcher.pathspecs()])
+    if not ok or not records:
+        log(f"No files found in {treeish}.", "ERROR")
+        return None
+
+    log(f"{treeish}: {len(records)} files under whitelisted paths.", "DEBUG")
+
+    entries = []
+    for record in records:
+        # "<mode> SP <type> SP <object> [SP+ <size>] TAB <path>"
+        meta, rel_path = record.split("\t", 1)
+        rel_path_normalized = rel_path.replace("\\", "/")
+
+        if not matcher.matches(rel_path_normalized):
+            log(f"  SKIP: {rel_path_normalized}", "DEBUG")
+            continue
+
+        mode, otype, sha, *size = meta.split()
+        size = int(size[0]) if size and size[0].isdigit() else 0
+        entries.append((mode, otype, sha, size, rel_path))
+        log(f"  + {rel_path_normalized}", "DEBUG")
+    return entries
+
+
+def build_filtered_index(treeish, whitelist, index_file):
+    """
+    Fill a private index with ONLY the whitelisted entries of treeish.
+    One ls-tree + one update-index, regardless of file count.
+    Returns (entries staged, blob bytes); entries is None on failure.
+    Blob sizes (ls-tree -l) are only requested for the journal/profile,
+    otherwise bytes is 0.
+    """
+    entries = filtered_tree_entries(treeish, whitelist,
+                                    sizes=JOURNAL.enabled or PROFILE.enabled)
+    if entries is None:
+        return None, 0
+    if not entries:
+        return 0, 0
+
+    index_info  = [f"{mode} {sha}\t{path}\0" for mode, _, sha, _, path in entries]
+    total_bytes = sum(size for *_, size, _ in entries)
+    ok, _ = run_ok(["git", "update-index", "-z", "--index-info"],
+                   input_text="".join(index_info), env=index_env(index_file))
+    if not ok:
+        log("git update-index failed while building filtered index.", "ERROR")
+        return None, 0
+    JOURNAL.count(files=len(index_info), bytes=total_bytes)
+    return len(index_info), total_bytes
+
+
+def copy_whitelisted_files(dev_branch, whitelist):
+    """
+    Copy ONLY whitelisted files from dev_branch to current working tree.
+    Filters the dev tree once into a private index (GIT_INDEX_FILE) and
+    writes it out with a single git checkout-index. Process count is
+    constant, no matter how many files are whitelisted.
+    """
+    import shutil
+    import tempfile
+    log(f"Copying whitelisted files from {dev_branch}...", "INFO")
+
+    tmp_dir    = tempfile.mkdtemp(prefix="sync-index-")
+    index_file = os.path.join(tmp_dir, "index")
+    try:
+        with JOURNAL.span("copy", source=dev_branch):
+            copied_count, copied_bytes = build_filtered_index(dev_branch, whitelist, index_file)
+            if not copied_count:
+                return False
+
+            ok, _ = run_ok(["git", "checkout-index", "-a", "-f"], env=index_env(index_file))
+            if not ok:
+                log("git checkout-index failed.", "ERROR")
+                return False
+            PROFILE.add_io("copy", written=copied_bytes)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    log(f"Copied {copied_count} whitelisted files.", "INFO")
+    return True
+
+
+# (commit sha, whitelist entries) -> filtered tree hash; content-addressed,
+# so entries never go stale within a run
+FILTERED_TREES = {}
+
+
+def filtered_tree_hash(treeish, whitelist):
+    """
+    Tree hash of the whitelisted subset of treeish (private index +
+    write-tree). Never touches HEAD, the real index or the working tree.
+    Returns None if treeish has no whitelisted files.
+    """
+    import shutil
+    import tempfile
+    obj = GIT.batch_check(treeish)
+    key = (obj[0] if obj else treeish, tuple(compile_whitelist(whitelist).entries))
+    if key in FILTERED_TREES:
+        return FILTERED_TREES[key]
+
+    tmp_dir    = tempfile.mkdtemp(prefix="sync-index-")
+    index_file = os.path.join(tmp_dir, "index")
+    try:
+        count, _ = build_filtered_index(treeish, whitelist, index_file)
+        if not count:
+            return None
+
+        ok, tree = run_ok(["git", "write-tree"], env=index_env(index_file))
+        if not ok or not tree:
+            log("git write-tree failed.", "ERROR")
+            return None
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    log(f"Filtered tree: {tree} ({count} files)", "DEBUG")
+    FILTERED_TREES[key] = tree
+    return tree
+
+
+def commit_filtered_tree(treeish, whitelist, message, parents=()):
+    """
+    Create a commit object whose tree is the whitelisted subset of treeish.
+    Never touches HEAD, the real index or the working tree.
+    parents=() creates a root (orphan) commit.
+    Returns the new commit hash (None on failure).
+    """
+    tree = filtered_tree_hash(treeish, whitelist)
+    if not tree:
+        return None
+
+    parent_args = [arg for p in parents for arg in ("-p", p)]
+    commit = run(["git", "commit-tree", tree, *parent_args, "-F", "-"], input_text=message)
+    log(f"Commit object created: {commit}", "DEBUG")
+    return commit
+
+
+def transition_worktree(current, target_tree):
+    """
+    Move index + working tree from current to target_tree with a two-tree
+    "git read-tree -m -u": only paths that differ are written or removed,
+    unchanged files keep their inode and mtime. Untracked files are left
+    alone (read-tree refuses to overwrite one that is in the way).
+    Returns (files touched, bytes written, bytes removed).
+    """
+    ok, fields = run_z(["git", "diff-tree", "-r", "-z", "--no-renames", current, target_tree])
+    if not ok:
+        log(f"git diff-tree {current} {target_tree} failed.", "ERROR")
+        sys.exit(1)
+
+    # ":<old mode> <new mode> <old sha> <new sha> <status>\0<path>\0"
+    counts  = {"A": 0, "M": 0, "D": 0, "T": 0}
+    written = removed = 0
+    for meta, path in zip(fields[0::2], fields[1::2]):
+        _, _, old_sha, new_sha, status = meta.lstrip(":").split()
+        counts[status] = counts.get(status, 0) + 1
+        if status != "D":
+            obj = GIT.batch_check(new_sha)
+            written += obj[2] if obj else 0
+        if status != "A":
+            obj = GIT.batch_check(old_sha)
+            removed += obj[2] if obj else 0
+        log(f"  {status} {path}", "DEBUG")
+    touched = sum(counts.values())
+
+    with JOURNAL.span("transition", files=touched):
+        if touched:
+            run(["git", "read-tree", "-m", "-u", current, target_tree])
+        JOURNAL.count(files=touched, bytes=written)
+        PROFILE.add_io("transition", written=written, removed=removed)
+
+    log(f"Transition: {counts['A']} added, {counts['M'] + counts['T']} modified, "
+        f"{counts['D']} removed ({written / 1024 / 1024:.2f} MB written, "
+        f"{removed / 1024 / 1024:.2f} MB replaced/removed).", "INFO")
+    return touched, written, removed
+
+
+def require_release_branch_not_checked_out(release_branch):
+    """Object-mode moves the release ref directly; it must not be HEAD."""
+    if current_branch() == release_branch:
+        log(f"'{release_branch}' is checked out. UpdateMode=objects must run from dev.", "ERROR")
+        log("Switch to the dev branch first.", "ERROR")
+        sys.exit(1)
+
+
+# ==============================================================================
+# INCREMENTAL BACKUP
+# Manifest (next to the backups) keeps the latest state:
+#   path -> [size, mtime_ns, sha256, archive holding that content]
+# Every archive also embeds the full state at its point in time, so any
+# point can be restored from the base plus its deltas.
+# ==============================================================================
+BACKUP_STATE_MEMBER = ".sync_backup_state.json"
+
+
+def backup_manifest_path(cfg):
+    project = cfgget(cfg, "RemoteProjectName", "PROJECT")
+    return os.path.join(os.path.dirname(SCRIPT_DIR), f"{project}_BACKUP_MANIFEST.json")
+
+
+def load_backup_manifest(path):
+    if not os.path.exists(path):
+        return {"points": [], "files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_backup_manifest(path, manifest):
+    if write_if_changed(path, json.dumps(manifest, indent=1)):
+        log(f"Backup manifest saved: {path}", "DEBUG")
+
+
+def sha256_file(path):
+    import hashlib
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(ZIP_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def scan_backup_changes(source_dir, previous, archive_name):
+    """
+    Compare source_dir against the previous state.
+    Hash is computed only when size or mtime differ.
+    Returns (new_state, changed [(full, rel)], removed [rel]).
+    """
+    state   = {}
+    changed = []
+    for root, dirs, files in os.walk(source_dir):
+        for filename in files:
+            full = os.path.join(root, filename)
+            rel  = os.path.relpath(full, source_dir).replace("\\", "/")
+            st   = os.stat(full)
+            old  = previous.get(rel)
+            if old and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+                state[rel] = old
+                continue
+            digest = sha256_file(full)
+            if old and old[2] == digest:
+                state[rel] = [st.st_size, st.st_mtime_ns, digest, old[3]]
+                continue
+            state[rel] = [st.st_size, st.st_mtime_ns, digest, archive_name]
+            changed.append((full, rel))
+    removed = [rel for rel in previous if rel not in state]
+    return state, changed, removed
+
+
+def select_backup_point(points, at):
+    """Pick a point by index (0 = base, -1 = latest) or archive name substring."""
+    if at is None:
+        return points[-1]
+    try:
+        return points[int(at)]
+    except (ValueError, IndexError):
+        pass
+    matches = [p for p in points if at in p["archive"]]
+    return matches[-1] if matches else None
+
+
+# ==============================================================================
+# OPERATIONS
+# ==============================================================================
+
+def cmd_dev_sync(cfg, version, args):
+    log("Starting DEV sync...", "INFO")
+    update_readme(cfg, version)
+
+    log(f"Git status: {STATUS.summary()}", "DEBUG")
+    for xy, path in STATUS.get()["entries"]:
+        log(f"  {xy} {display_path(path)}", "DEBUG")
+
+    if not STATUS.dirty:
+        log("Nothing to commit. DEV sync aborted.", "INFO")
+        return
+
+    LOG.materialize()
+    default_msg = f"[{version}] | auto commit dev sync"
+    commit_msg  = default_msg if args.yes else ask_commit_msg(default_msg)
+
+    with JOURNAL.span("commit", branch=cfgget(cfg, "DevBranch", "dev")):
+        run(["git", "add", "."])
+        run(["git", "commit", "-m", commit_msg])
+    push_branch(cfgget(cfg, "DevRemote", "origin"), cfgget(cfg, "DevBranch", "dev"))
+    log("DEV sync finished.", "INFO")
+
+
+def cmd_zip(cfg, version):
+    whitelist = parse_whitelist(cfg)
+    log(f"Whitelist entries ({len(whitelist)}): {whitelist}", "DEBUG")
+
+    name = backup_name(cfg, "LOCAL_ZIP", version, remote="LOCAL")
+    out  = os.path.join(SCRIPT_DIR, name)
+
+    if zip_source(cfg) == "git":
+        create_zip_from_tree(cfgget(cfg, "DevBranch", "dev"), out, whitelist,
+                             cache_dir=artifact_cache(cfg), **zip_options(cfg))
+    else:
+        create_zip(SCRIPT_DIR, out, whitelist=whitelist, include_git=False,
+                   cache_dir=artifact_cache(cfg), **zip_options(cfg))
+    log("ZIP finished.", "INFO")
+
+
+def cmd_full_backup(cfg, version):
+    name       = backup_name(cfg, "FULL_BACKUP", version, remote="LOCAL")
+    parent_dir = os.path.dirname(SCRIPT_DIR)
+    out        = os.path.join(parent_dir, name)
+
+    log(f"Full backup -> {out}", "INFO")
+    log("No filter. .git INCLUDED. Complete snapshot.", "INFO")
+
+    create_zip(SCRIPT_DIR, out, whitelist=None, include_git=True,
+               **zip_options(cfg))
+    log("Full backup finished.", "INFO")
+
+
+def update_mode(cfg):
+    """Return validated UpdateMode (worktree | objects | diff)."""
+    mode = cfgget(cfg, "UpdateMode", "worktree").strip().lower()
+    if mode not in UPDATE_MODES:
+        log(f"Invalid UpdateMode '{mode}'. Use one of: {', '.join(UPDATE_MODES)}", "ERROR")
+        sys.exit(1)
+    return mode
+
+
+def path_size(path):
+    """Bytes under path (file or directory tree), symlinks not followed."""
+    if not os.path.isdir(path) or os.path.islink(path):
+        return os.lstat(path).st_size
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def wipe_working_tree(protected_items):
+    """Remove everything in SCRIPT_DIR except protected items."""
+    import shutil
+    log(f"Protected items: {protected_items}", "DEBUG")
+    STATUS.invalidate()
+    with JOURNAL.span("wipe"):
+        for item in os.listdir(SCRIPT_DIR):
+            if item in protected_items:
+                log(f"  PROTECTED: {item}", "DEBUG")
+                continue
+            path = os.path.join(SCRIPT_DIR, item)
+            try:
+                if PROFILE.enabled:
+                    PROFILE.add_io("wipe", removed=path_size(path))
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                JOURNAL.count(files=1)
+                log(f"  REMOVED: {item}", "DEBUG")
+            except Exception as e:
+                log(f"Failed to remove {item}: {e}", "DEBUG")
+    log("Working tree wiped.", "DEBUG")
+
+
+def fetch_release_branch(cfg):
+    """Fetch ReleaseRemote/ReleaseBranch if it exists. Returns True if fetched."""
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+    release_remote = cfgget(cfg, "ReleaseRemote", "origin")
+    if not branch_exists_remote(release_remote, release_branch):
+        return False
+    log(f"Fetching {release_remote}/{release_branch}...", "INFO")
+    fetch_remote_branch(release_remote, release_branch)
+    return True
+
+
+def published_release_ref(cfg):
+    """ReleaseRemote/ReleaseBranch, local ReleaseBranch if the remote branch does not exist, else None."""
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+    release_remote = cfgget(cfg, "ReleaseRemote", "origin")
+    if branch_exists_remote(release_remote, release_branch):
+        return f"{release_remote}/{release_branch}"
+    if branch_exists_local(release_branch):
+        return release_branch
+    return None
+
+
+def release_tree_matches(cfg):
+    """
+    True if the whitelisted DevBranch tree equals the published tree
+    (ReleaseRemote/ReleaseBranch^{tree}, local ReleaseBranch if the
+    remote branch does not exist). Compares hashes only, no checkout.
+    Runs in its own "precheck" span so the filtered-index counters are
+    not added to the enclosing "run" span.
+    """
+    dev_branch = cfgget(cfg, "DevBranch", "dev")
+
+    with JOURNAL.span("precheck", branch=dev_branch):
+        published = published_release_ref(cfg)
+        if published is None:
+            return False
+
+        dev_tree     = filtered_tree_hash(dev_branch, parse_whitelist(cfg))
+        release_tree = GIT.batch_check(f"{published}^{{tree}}")
+    log(f"Filtered {dev_branch} tree: {dev_tree}", "DEBUG")
+    log(f"{published} tree: {release_tree[0] if release_tree else None}", "DEBUG")
+    return dev_tree is not None and release_tree is not None and dev_tree == release_tree[0]
+
+
+def push_release_branch(cfg, force=False):
+    """Push ReleaseBranch to ReleaseRemote."""
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+    release_remote = cfgget(cfg, "ReleaseRemote", "origin")
+    log(f"{'Force-pushing' if force else 'Pushing'} to {release_remote}/{release_branch}...", "INFO")
+    push_branch(release_remote, release_branch, force=force)
+
+
+def checkout_release_branch(cfg, fetched=False):
+    """Checkout ReleaseBranch and hard-reset it to the remote (if it exists)."""
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+    release_remote = cfgget(cfg, "ReleaseRemote", "origin")
+
+    # Checkout master
+    log(f"Switching to {release_branch}...", "INFO")
+    if branch_exists_local(release_branch):
+        run(["git", "checkout", release_branch])
+    elif branch_exists_remote(release_remote, release_branch):
+        run(["git", "checkout", "-b", release_branch, f"{release_remote}/{release_branch}"])
+    else:
+        log(f"Release branch '{release_branch}' not found.", "ERROR")
+        log(f"Create it: git checkout -b {release_branch} && git push -u {release_remote} {release_branch}", "ERROR")
+        sys.exit(1)
+
+    # Sync with remote master (fetch + reset, NO pull/merge!)
+    if branch_exists_remote(release_remote, release_branch):
+        log("=" * 70, "INFO")
+        log("CRITICAL STEP: Syncing local master with remote", "INFO")
+        log("Method: fetch + reset --hard (NO pull/merge!)", "INFO")
+        log("This guarantees ZERO dev history leak.", "INFO")
+        log("=" * 70, "INFO")
+
+        if not fetched:
+            fetch_remote_branch(release_remote, release_branch)
+        run(["git", "reset", "--hard", f"{release_remote}/{release_branch}"])
+
+        log("Local master is now IDENTICAL to remote master.", "INFO")
+
+
+def update_master_worktree(cfg, commit_msg, fetched=False, push=True):
+    """
+    UpdateMode=worktree: checkout master, reset to remote, wipe, copy, commit, push.
+    fetched=True: the release branch was already fetched by the caller.
+    push=False: leave the push to the caller.
+    """
+    dev_branch      = cfgget(cfg, "DevBranch",     "dev")
+    release_branch  = cfgget(cfg, "ReleaseBranch", "master")
+    whitelist       = parse_whitelist(cfg)
+    protected_items = get_protected_items(cfg)
+
+    checkout_release_branch(cfg, fetched=fetched)
+
+    # WIPE CLEAN (except protected items)
+    log("Wiping master working tree (except protected items)...", "INFO")
+    wipe_working_tree(protected_items)
+
+    # COPY whitelisted files
+    success = copy_whitelisted_files(dev_branch, whitelist)
+    if not success:
+        log("CRITICAL: File copy failed.", "ERROR")
+        sys.exit(1)
+
+    # Commit
+    with JOURNAL.span("commit", branch=release_branch):
+        run(["git", "add", "."])
+        run(["git", "commit", "--allow-empty", "-m", commit_msg])
+
+    # Push
+    if push:
+        push_release_branch(cfg)
+
+
+def update_master_diff(cfg, commit_msg, fetched=False, push=True):
+    """
+    UpdateMode=diff: checkout master, reset to remote, move the worktree to
+    the whitelisted dev tree (only differing paths), commit, push.
+    Nothing is wiped; the commit is made from the index, so untracked
+    files in the working tree never reach master.
+    """
+    dev_branch     = cfgget(cfg, "DevBranch",     "dev")
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+
+    target_tree = filtered_tree_hash(dev_branch, parse_whitelist(cfg))
+    if not target_tree:
+        log(f"CRITICAL: No whitelisted files in {dev_branch}.", "ERROR")
+        sys.exit(1)
+
+    checkout_release_branch(cfg, fetched=fetched)
+
+    log(f"Moving {release_branch} to the whitelisted {dev_branch} tree...", "INFO")
+    transition_worktree("HEAD", target_tree)
+
+    with JOURNAL.span("commit", branch=release_branch):
+        run(["git", "commit", "--allow-empty", "-m", commit_msg])
+
+    if push:
+        push_release_branch(cfg)
+
+
+def update_master_objects(cfg, commit_msg, fetched=False, push=True):
+    """
+    UpdateMode=objects: build master commit straight from the object database.
+    No checkout, no wipe, working tree and index are never touched.
+    fetched=True: the release branch was already fetched by the caller.
+    push=False: leave the push to the caller.
+    """
+    dev_branch     = cfgget(cfg, "DevBranch",     "dev")
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+    release_remote = cfgget(cfg, "ReleaseRemote", "origin")
+    whitelist      = parse_whitelist(cfg)
+
+    require_release_branch_not_checked_out(release_branch)
+
+    if branch_exists_remote(release_remote, release_branch):
+        if not fetched:
+            log(f"Fetching {release_remote}/{release_branch} (parent of new commit)...", "INFO")
+            fetch_remote_branch(release_remote, release_branch)
+        parent = f"{release_remote}/{release_branch}"
+    elif branch_exists_local(release_branch):
+        parent = release_branch
+    else:
+        log(f"Release branch '{release_branch}' not found.", "ERROR")
+        log(f"Create it: git checkout -b {release_branch} && git push -u {release_remote} {release_branch}", "ERROR")
+        sys.exit(1)
+
+    with JOURNAL.span("commit", branch=release_branch):
+        commit = commit_filtered_tree(dev_branch, whitelist, commit_msg, parents=[parent])
+        if not commit:
+            log("CRITICAL: Could not build master commit from dev tree.", "ERROR")
+            sys.exit(1)
+
+        run(["git", "update-ref", f"refs/heads/{release_branch}", commit])
+
+    if push:
+        push_release_branch(cfg)
+
+
+def cmd_incremental_backup(cfg, version):
+    """
+    Base + delta backups keyed on content hashes.
+    First run (or missing manifest) writes a FULL_BACKUP base,
+    later runs write DELTA_BACKUP archives with changed/new files only.
+    """
+    parent_dir    = os.path.dirname(SCRIPT_DIR)
+    manifest_path = backup_manifest_path(cfg)
+    manifest      = load_backup_manifest(manifest_path)
+    is_base       = not manifest["points"]
+    btype         = "FULL_BACKUP" if is_base else "DELTA_BACKUP"
+    name          = backup_name(cfg, btype, version, remote="LOCAL")
+    out           = os.path.join(parent_dir, name)
+
+    log(f"Incremental backup ({btype}) -> {out}", "INFO")
+    log(f"Manifest: {manifest_path}", "DEBUG")
+
+    previous = {} if is_base else manifest["files"]
+    state, changed, removed = scan_backup_changes(SCRIPT_DIR, previous, name)
+    log(f"Scanned {len(state)} files: {len(changed)} changed/new, {len(removed)} removed.", "INFO")
+
+    if not is_base and not changed and not removed:
+        manifest["files"] = state
+        save_backup_manifest(manifest_path, manifest)
+        log("No changes since last backup. Nothing written.", "INFO")
+        return
+
+    with JOURNAL.span("zip", archive=name):
+        with ParallelZipWriter(out, **zip_options(cfg)) as z:
+            for full, rel in changed:
+                z.add_file(full, rel)
+                log(f"  + {rel}", "DEBUG")
+            z.add_bytes(json.dumps(state).encode("utf-8"), BACKUP_STATE_MEMBER)
+        JOURNAL.count(files=len(z.central), bytes=os.path.getsize(out))
+        PROFILE.add_io("zip", read=sum(e[7] for e in z.central), written=os.path.getsize(out))
+    z.report()
+
+    manifest["points"].append({
+        "archive": name,
+        "type":    btype,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "changed": len(changed),
+        "removed": len(removed),
+    })
+    manifest["files"] = state
+    save_backup_manifest(manifest_path, manifest)
+
+    size_mb = os.path.getsize(out) / (1024 * 1024)
+    log(f"Backup point #{len(manifest['points']) - 1} written ({size_mb:.2f} MB).", "INFO")
+    log("Incremental backup finished.", "INFO")
+
+
+def cmd_restore_backup(cfg, args):
+    """Rebuild any backup point (base + deltas) into an empty directory."""
+    import shutil
+    import zipfile
+    dest          = os.path.abspath(args.restore_backup)
+    backup_dir    = os.path.dirname(SCRIPT_DIR)
+    manifest_path = backup_manifest_path(cfg)
+    manifest      = load_backup_manifest(manifest_path)
+
+    if not manifest["points"]:
+        log(f"No incremental backups found ({manifest_path}).", "ERROR")
+        sys.exit(1)
+    if os.path.isdir(dest) and os.listdir(dest):
+        log(f"Restore target is not empty: {dest}", "ERROR")
+        sys.exit(1)
+
+    point = select_backup_point(manifest["points"], args.at)
+    if point is None:
+        log(f"Backup point '{args.at}' not found.", "ERROR")
+        for i, p in enumerate(manifest["points"]):
+            log(f"  #{i}  {p['created']}  {p['archive']}", "INFO")
+        sys.exit(1)
+    log(f"Restoring {point['archive']} ({point['created']}) -> {dest}", "INFO")
+
+    if not os.path.isfile(os.path.join(backup_dir, point["archive"])):
+        log(f"Backup archive missing: {os.path.join(backup_dir, point['archive'])}", "ERROR")
+        sys.exit(1)
+    with zipfile.ZipFile(os.path.join(backup_dir, point["archive"])) as z:
+        state = json.loads(z.read(BACKUP_STATE_MEMBER))
+
+    by_archive = {}
+    for rel, entry in state.items():
+        by_archive.setdefault(entry[3], []).append(rel)
+
+    # check the whole chain before extracting anything
+    missing = [a for a in by_archive if not os.path.isfile(os.path.join(backup_dir, a))]
+    if missing:
+        log(f"Backup chain of {point['archive']} is incomplete, nothing restored.", "ERROR")
+        for archive in missing:
+            log(f"  missing: {os.path.join(backup_dir, archive)} ({len(by_archive[archive])} files)", "ERROR")
+        sys.exit(1)
+
+    for archive, rels in by_archive.items():
+        log(f"  {archive}: {len(rels)} files", "DEBUG")
+        with zipfile.ZipFile(os.path.join(backup_dir, archive)) as z:
+            members = {zip_member_path(info): info for info in z.infolist()}
+            for rel in rels:
+                target = os.path.join(dest, *rel.split("/"))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with z.open(members[rel]) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst, ZIP_CHUNK)
+                mtime_ns = state[rel][1]
+                os.utime(target, ns=(mtime_ns, mtime_ns))
+
+    log(f"Restored {len(state)} files from {len(by_archive)} archive(s).", "INFO")
+    log("RESTORE finished.", "INFO")
+
+
+def cmd_update(cfg, version, args, push=True):
+    """
+    Clean slate master update with ZERO dev history leak.
+    
+    Flow (UpdateMode=worktree):
+    1. Checkout master
+    2. Fetch + reset --hard to remote master (clean slate)
+    3. Wipe + copy whitelisted files from dev
+    4. Commit (+1 commit on master)
+    5. Push (fast-forward)
+
+    Flow (UpdateMode=objects):
+    1. Fetch remote master
+    2. Filter dev tree into a private index, write-tree
+    3. commit-tree -p <remote>/<master> (+1 commit on master)
+    4. update-ref + push (branch is never checked out)
+
+    Flow (UpdateMode=diff):
+    1. Checkout master, fetch + reset --hard to remote master
+    2. read-tree -m -u to the filtered dev tree (changed paths only)
+    3. Commit + push
+    
+    Guarantees ZERO dev history on public master.
+
+    Unless --force, the filtered dev tree hash is compared with the
+    published master tree first; if they match nothing is committed.
+    push=False commits master but leaves the push to the caller (--release).
+    Returns the new master commit hash, or None if master was unchanged.
+    """
+    mode           = update_mode(cfg)
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+    commit         = None
+
+    with DevSafetyGuard("update", cfg):
+        # Update metadata on dev
+        update_readme(cfg, version)
+        update_changelog(cfg, version)
+
+        if STATUS.dirty:
+            with JOURNAL.span("commit", branch=cfgget(cfg, "DevBranch", "dev")):
+                run(["git", "add", "."])
+                run(["git", "commit", "-m", f"[{version}] | readme + changelog update"])
+
+        # Skip no-op publishes (hash compare, no checkout)
+        fetched   = False
+        unchanged = False
+        if not args.force:
+            fetched   = fetch_release_branch(cfg)
+            unchanged = release_tree_matches(cfg)
+
+        if unchanged:
+            log("Public master already has the whitelisted dev content.", "INFO")
+            log("Nothing to publish (use --force to commit anyway).", "INFO")
+        else:
+            # Get commit message
+            default_msg = f"[{version}] | public update"
+            commit_msg  = default_msg if args.yes else ask_commit_msg(default_msg)
+
+            if mode == "objects":
+                update_master_objects(cfg, commit_msg, fetched=fetched, push=push)
+            elif mode == "diff":
+                update_master_diff(cfg, commit_msg, fetched=fetched, push=push)
+            else:
+                update_master_worktree(cfg, commit_msg, fetched=fetched, push=push)
+            commit = GIT.batch_check(f"refs/heads/{release_branch}^{{commit}}")[0]
+
+            log("=" * 70, "INFO")
+            log("Public master updated successfully.", "INFO")
+            log("Master history: clean, linear, ZERO dev commits.", "INFO")
+            log("=" * 70, "INFO")
+
+    if unchanged:
+        log("UPDATE skipped (master unchanged).", "INFO")
+        return None
+    log("UPDATE finished.", "INFO")
+    return commit
+
+
+def build_source_zip(cfg, version, source, cache_dir, commit):
+    """
+    SOURCE ZIP of the whitelisted files (ZipSource). Returns its path.
+    ZipSource=git zips commit: the master commit being released, never the
+    local ReleaseBranch name (stale or missing when the update was skipped).
+    """
+    release_remote = cfgget(cfg, "ReleaseRemote", "origin")
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+    whitelist      = parse_whitelist(cfg)
+    src_path       = os.path.join(SCRIPT_DIR, backup_name(cfg, "SOURCE", version,
+                                                          remote=release_remote, branch=release_branch))
+    log("Creating SOURCE ZIP...", "INFO")
+    if source == "git":
+        log(f"  From commit : {commit}", "DEBUG")
+        create_zip_from_tree(commit, src_path, whitelist,
+                             cache_dir=cache_dir, **zip_options(cfg))
+    else:
+        create_zip(SCRIPT_DIR, src_path, whitelist=whitelist, include_git=False,
+                   cache_dir=cache_dir, **zip_options(cfg))
+    return src_path
+
+
+def build_bin_zip(cfg, version, bin_path_abs, cache_dir):
+    """BIN ZIP of BinaryStagingDir. Returns its path."""
+    release_remote = cfgget(cfg, "ReleaseRemote", "origin")
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+    bin_zip        = os.path.join(SCRIPT_DIR, backup_name(cfg, "BIN", version,
+                                                          remote=release_remote, branch=release_branch))
+    log(f"Creating BIN ZIP from {bin_path_abs}...", "INFO")
+    create_zip(bin_path_abs, bin_zip, whitelist=None, include_git=False,
+               cache_dir=cache_dir, **zip_options(cfg))
+    return bin_zip
+
+
+def upload_release_asset(tag, path):
+    log(f"Uploading {os.path.basename(path)} to {tag}...", "INFO")
+    with JOURNAL.span("upload", tag=tag, asset=os.path.basename(path)):
+        JOURNAL.count(files=1, bytes=os.path.getsize(path))
+        run(["gh", "release", "upload", tag, path])
+
+
+def cmd_release(cfg, version, args):
+    """
+    --update (commit only), then a small task graph:
+
+      push ──────────► gh release create ──┬──► upload SOURCE ──┬──► publish
+      SOURCE ZIP ──────────────────────────┤                    │
+      BIN ZIP ─────────────────────────────┴──► upload BIN ─────┘
+
+    Both ZIPs build while the push runs. The release is created as a
+    draft once the push is done (its tag must point at the pushed master)
+    and every asset is uploaded as soon as its ZIP is finished. It is
+    published only after all uploads succeeded; if a ZIP or an upload
+    fails the draft is deleted, so no release is ever public without its
+    assets.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+    require_gh()
+
+    bin_dir        = cfgget(cfg, "BinaryStagingDir", "build_staging")
+    bin_path_abs   = os.path.join(SCRIPT_DIR, bin_dir)
+    source         = zip_source(cfg)
+    cache_dir      = artifact_cache(cfg)
+    tag            = f"v{version}"
+
+    updated = cmd_update(cfg, version, args, push=False)
+    if updated:
+        release_commit = updated
+    else:
+        log("Master unchanged - releasing the current public master.", "INFO")
+        published      = published_release_ref(cfg)
+        resolved       = GIT.batch_check(f"{published}^{{commit}}") if published else None
+        if resolved is None:
+            log(f"Release branch '{cfgget(cfg, 'ReleaseBranch', 'master')}' not found.", "ERROR")
+            sys.exit(1)
+        release_commit = resolved[0]
+    if not os.path.isdir(bin_path_abs):
+        log(f"Binary dir '{bin_dir}' not found - skipping BIN ZIP.", "INFO")
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        push_task = pool.submit(push_release_branch, cfg) if updated else None
+        zip_tasks = [pool.submit(build_source_zip, cfg, version, source, cache_dir, release_commit)]
+        if os.path.isdir(bin_path_abs):
+            zip_tasks.append(pool.submit(build_bin_zip, cfg, version, bin_path_abs, cache_dir))
+
+        if push_task is not None:
+            push_task.result()
+
+        log(f"Creating GitHub Release: {tag} (draft until all assets are uploaded)", "INFO")
+        with JOURNAL.span("upload", tag=tag):
+            run(["gh", "release", "create", tag, "--draft",
+                 "--title", f"Release {tag}",
+                 "--notes", f"Release {tag}"])
+
+        uploads = []
+        try:
+            for task in as_completed(zip_tasks):
+                uploads.append(pool.submit(upload_release_asset, tag, task.result()))
+            for upload in uploads:
+                upload.result()
+        except BaseException:
+            wait(uploads)
+            log(f"Release assets incomplete - deleting draft release {tag}.", "ERROR")
+            run(["gh", "release", "delete", tag, "--yes"], abort_on_error=False)
+            raise
+
+        log(f"Publishing GitHub Release: {tag}", "INFO")
+        with JOURNAL.span("upload", tag=tag, step="publish"):
+            run(["gh", "release", "edit", tag, "--draft=false"])
+
+    log("RELEASE finished.", "INFO")
+
+
+def deploy_worktree(cfg, commit_msg):
+    """
+    UpdateMode=worktree: orphan temp branch, clear index, wipe, copy, commit.
+    Returns the orphan commit hash (temp branch stays checked out).
+    """
+    dev_branch      = cfgget(cfg, "DevBranch", "dev")
+    whitelist       = parse_whitelist(cfg)
+    protected_items = get_protected_items(cfg)
+
+    # Create orphan temporary branch
+    temp_branch = f"temp-deploy-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    log(f"Creating orphan branch: {temp_branch}", "INFO")
+    run(["git", "checkout", "--orphan", temp_branch])
+
+    # CRITICAL: Clear git index to ensure true orphan commit
+    log("Clearing git index (ensures ZERO parent commits)...", "INFO")
+    run(["git", "rm", "-rf", "."], abort_on_error=False)
+
+    # WIPE CLEAN (except protected items)
+    log("Wiping working tree (except protected items)...", "INFO")
+    wipe_working_tree(protected_items)
+
+    # COPY ONLY whitelisted files from dev
+    log("=" * 70, "INFO")
+    log("CRITICAL: Copying ONLY whitelisted files from dev", "INFO")
+    log("This ensures ZERO non-public files on master", "INFO")
+    log("=" * 70, "INFO")
+
+    success = copy_whitelisted_files(dev_branch, whitelist)
+    if not success:
+        log("CRITICAL: File copy failed.", "ERROR")
+        run(["git", "checkout", dev_branch], abort_on_error=False)
+        run(["git", "branch", "-D", temp_branch], abort_on_error=False)
+        sys.exit(1)
+
+    # Create orphan commit (ZERO parents)
+    log("Creating orphan commit (ZERO history)...", "INFO")
+    with JOURNAL.span("commit", branch=temp_branch):
+        run(["git", "add", "."])
+        run(["git", "commit", "-m", commit_msg])
+
+    orphan_commit = get_current_commit()
+    log(f"Orphan commit created: {orphan_commit}", "DEBUG")
+    return orphan_commit
+
+
+def deploy_diff(cfg, commit_msg):
+    """
+    UpdateMode=diff: orphan temp branch moved from the current tree to the
+    whitelisted dev tree (only differing paths), orphan commit.
+    Returns the orphan commit hash (temp branch stays checked out).
+    """
+    dev_branch = cfgget(cfg, "DevBranch", "dev")
+
+    target_tree = filtered_tree_hash(dev_branch, parse_whitelist(cfg))
+    if not target_tree:
+        log(f"CRITICAL: No whitelisted files in {dev_branch}.", "ERROR")
+        sys.exit(1)
+    current = get_current_commit()
+
+    temp_branch = f"temp-deploy-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    log(f"Creating orphan branch: {temp_branch}", "INFO")
+    run(["git", "checkout", "--orphan", temp_branch])
+
+    log(f"Moving working tree to the whitelisted {dev_branch} tree...", "INFO")
+    transition_worktree(current, target_tree)
+
+    log("Creating orphan commit (ZERO history)...", "INFO")
+    with JOURNAL.span("commit", branch=temp_branch):
+        run(["git", "commit", "-m", commit_msg])
+
+    orphan_commit = get_current_commit()
+    log(f"Orphan commit created: {orphan_commit}", "DEBUG")
+    return orphan_commit
+
+
+def deploy_objects(cfg, commit_msg):
+    """
+    UpdateMode=objects: root commit (ZERO parents) built with commit-tree.
+    No checkout, no wipe. Returns the orphan commit hash.
+    """
+    dev_branch     = cfgget(cfg, "DevBranch",     "dev")
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+    whitelist      = parse_whitelist(cfg)
+
+    require_release_branch_not_checked_out(release_branch)
+
+    log("Creating orphan commit from dev tree (ZERO history)...", "INFO")
+    with JOURNAL.span("commit", branch=release_branch):
+        orphan_commit = commit_filtered_tree(dev_branch, whitelist, commit_msg, parents=())
+    if not orphan_commit:
+        log("CRITICAL: Could not build orphan commit from dev tree.", "ERROR")
+        sys.exit(1)
+    log(f"Orphan commit created: {orphan_commit}", "DEBUG")
+    return orphan_commit
+
+
+def cmd_deploy(cfg, version, args):
+    """
+    WIPE master history completely. Creates orphan commit with WHITELISTED files only.
+    
+    CRITICAL FIX in v1.22.0:
+    - Clears git index after checkout --orphan
+    - Ensures ZERO parent commits (true orphan)
+    - Previous commits become unreachable
+    
+    Use this for:
+    - Initial release (first time setup)
+    - Cleanup when master has unwanted history
+    
+    Flow (UpdateMode=worktree):
+    1. Checkout orphan temp branch
+    2. CLEAR git index (git rm -rf .)
+    3. Copy ONLY whitelisted files from dev
+    4. Create orphan commit (ZERO parents)
+    5. Force update master ref to this commit
+    6. Force push
+
+    Flow (UpdateMode=objects):
+    1. Filter dev tree into a private index, write-tree
+    2. commit-tree with NO -p (ZERO parents)
+    3. update-ref master + force push (no checkout, no wipe)
+
+    Flow (UpdateMode=diff):
+    1. Checkout orphan temp branch (index kept)
+    2. read-tree -m -u to the filtered dev tree (changed paths only)
+    3. Orphan commit, then as worktree steps 5-6
+    
+    This ensures master has EXACTLY 1 commit with ONLY whitelisted files.
+    Previous commits become unreachable and will be garbage collected.
+    
+    WARNING: Force pushes to remote. Developers will need to:
+      git fetch origin
+      git reset --hard origin/master
+    """
+    require_gh()
+
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+    release_remote = cfgget(cfg, "ReleaseRemote", "origin")
+    mode           = update_mode(cfg)
+
+    if not args.yes:
+        print()
+        print("  WARNING: --deploy will DESTROY public master history.")
+        print(f"     Remote: {release_remote}")
+        print(f"     Branch: {release_branch}")
+        print()
+        print("  This creates a NEW orphan commit with ZERO history.")
+        print("  Previous commits become unreachable.")
+        print()
+        print("  Developers will need to sync with:")
+        print(f"     git fetch {release_remote}")
+        print(f"     git reset --hard {release_remote}/{release_branch}")
+        print()
+        print("  For normal updates, use --update instead.")
+        print()
+        ans = input("     Type YES to confirm: ").strip()
+        if ans != "YES":
+            log("Deploy aborted.", "INFO")
+            sys.exit(0)
+
+    default_msg = f"[{version}] | initial release"
+    commit_msg  = default_msg if args.yes else ask_commit_msg(default_msg)
+
+    with DevSafetyGuard("deploy", cfg):
+        if mode == "objects":
+            orphan_commit = deploy_objects(cfg, commit_msg)
+        elif mode == "diff":
+            orphan_commit = deploy_diff(cfg, commit_msg)
+        else:
+            orphan_commit = deploy_worktree(cfg, commit_msg)
+
+        # Verify commit has ZERO parents
+        ok, parents = run_ok(["git", "log", "--pretty=%P", "-n", "1", orphan_commit])
+        if parents.strip():
+            log(f"ERROR: Commit has parents: {parents}", "ERROR")
+            log("This should be an orphan commit with ZERO parents!", "ERROR")
+            sys.exit(1)
+        log("Verified: Commit has ZERO parents (true orphan).", "INFO")
+
+        # Force update master branch to point to orphan commit
+        log(f"Updating {release_branch} ref to orphan commit...", "INFO")
+        if mode == "objects":
+            run(["git", "update-ref", f"refs/heads/{release_branch}", orphan_commit])
+        else:
+            run(["git", "branch", "-D", release_branch], abort_on_error=False)  # delete old master
+            run(["git", "branch", "-m", release_branch])  # rename temp to master
+
+        # Force push
+        push_release_branch(cfg, force=True)
+
+        log("", "INFO")
+        log("=" * 70, "INFO")
+        log("DEPLOY finished. Master history WIPED.", "INFO")
+        log(f"Master now has EXACTLY 1 commit: {orphan_commit[:8]}", "INFO")
+        log("Master contains ONLY whitelisted files.", "INFO")
+        log("Previous commits are unreachable (will be GC'd).", "INFO")
+        log("", "INFO")
+        log("Other developers need to sync master with:", "INFO")
+        log(f"  git fetch {release_remote}", "INFO")
+        log(f"  git reset --hard {release_remote}/{release_branch}", "INFO")
+        log("=" * 70, "INFO")
+
+    log("DEPLOY finished.", "INFO")
+
+
+def cmd_gc_safety(cfg):
+    """Prune expired safety branches now and report reclaimed refs/space."""
+    _, _, mode, _ = safety_retention(cfg)
+    if mode == "off":
+        mode = "archive"
+    refs_before, loose_before, loose_bytes_before, packed_before = ref_storage_stats()
+
+    pruned = prune_safety_branches(cfg, force_mode=mode)
+    if not pruned:
+        run(["git", "pack-refs", "--all", "--prune"])
+
+    refs_after, loose_after, loose_bytes_after, packed_after = ref_storage_stats()
+    _, archived = run_ok(["git", "for-each-ref", "--format=%(refname)", SAFETY_ARCHIVE_NS])
+
+    log("=" * 70, "INFO")
+    log(f"Safety refs pruned   : {pruned} ({mode})", "INFO")
+    log(f"Archived safety refs : {len(archived.splitlines())} under {SAFETY_ARCHIVE_NS}", "INFO")
+    log(f"Refs total           : {refs_before} -> {refs_after}", "INFO")
+    log(f"Loose ref files      : {loose_before} -> {loose_after} "
+        f"({loose_bytes_before - loose_bytes_after} bytes reclaimed)", "INFO")
+    log(f"packed-refs size     : {packed_before} -> {packed_after} bytes", "INFO")
+    if mode == "delete" and pruned:
+        log("Snapshot objects are now unreachable and will go with the next git gc.", "INFO")
+    log("=" * 70, "INFO")
+    log("GC-SAFETY finished.", "INFO")
+
+
+def read_journal(path):
+    """Events of one .jsonl run journal (truncated/garbled lines skipped)."""
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    return events
+
+
+def cmd_log_summary(cfg):
+    """Per-command, per-phase timing table across all run journals in LogDir."""
+    log_dir = os.path.join(SCRIPT_DIR, cfgget(cfg, "LogDir", "logs"))
+    paths   = sorted(os.path.join(log_dir, n) for n in os.listdir(log_dir)
+                     if n.endswith(".jsonl") and os.path.join(log_dir, n) != JOURNAL.path)
+    if not paths:
+        log(f"No run journals in {log_dir}. Set EnableJsonLog=true.", "INFO")
+        return
+
+    # (command, phase) -> {"runs", "spans", "total", "max", "last", "execs", "files", "bytes"}
+    stats = {}
+    execs = {}
+    for path in paths:
+        events  = read_journal(path)
+        command = next((e.get("command") for e in events if e.get("event") == "run_start"), "?")
+        seen    = set()
+        for e in events:
+            key = (command, e.get("phase"))
+            if e.get("event") == "span_end":
+                row = stats.setdefault(key, {"runs": 0, "spans": 0, "total": 0.0, "max": 0.0,
+                                             "last": 0.0, "execs": 0, "files": 0, "bytes": 0})
+                if key not in seen:
+                    seen.add(key)
+                    row["runs"] += 1
+                row["spans"] += 1
+                row["total"] += e.get("duration", 0.0)
+                row["max"]    = max(row["max"], e.get("duration", 0.0))
+                row["last"]   = e.get("duration", 0.0)
+                row["files"] += e.get("files", 0)
+                row["bytes"] += e.get("bytes", 0)
+            elif e.get("event") == "exec":
+                execs[key] = execs.get(key, 0) + 1
+    for key, n in execs.items():
+        if key in stats:
+            stats[key]["execs"] = n
+
+    log(f"Run journals: {len(paths)} in {log_dir}", "INFO")
+    log("=" * 100, "INFO")
+    log(f"{'Command':<20} {'Phase':<14} {'Runs':>5} {'Spans':>6} {'Mean s':>9} {'Max s':>9} "
+        f"{'Last s':>9} {'Execs':>6} {'Files':>7} {'MB':>9}", "INFO")
+    log("-" * 100, "INFO")
+    for (command, phase), row in sorted(stats.items(), key=lambda kv: (kv[0][0], -kv[1]["total"])):
+        log(f"{command:<20} {phase:<14} {row['runs']:>5} {row['spans']:>6} "
+            f"{row['total'] / row['spans']:>9.3f} {row['max']:>9.3f} {row['last']:>9.3f} "
+            f"{row['execs']:>6} {row['files']:>7} {row['bytes'] / (1024 * 1024):>9.2f}", "INFO")
+    log("=" * 100, "INFO")
+    log("LOG-SUMMARY finished.", "INFO")
+
+
+def cmd_reset(cfg, args):
+    release_branch = cfgget(cfg, "ReleaseBranch", "master")
+    release_remote = cfgget(cfg, "ReleaseRemote", "origin")
+
+    if not args.yes:
+        print()
+        print(f"  WARNING: --reset will OVERWRITE local {release_branch}.")
+        print()
+        ans = input("  Type YES to confirm: ").strip()
+        if ans != "YES":
+            log("Reset aborted.", "INFO")
+            sys.exit(0)
+
+    with DevSafetyGuard("reset", cfg):
+        log(f"Switching to {release_branch}...", "INFO")
+        run(["git", "checkout", release_branch])
+
+        log(f"Fetching {release_remote}/{release_branch}...", "INFO")
+        fetch_remote_branch(release_remote, release_branch)
+
+        log(f"Hard reset to {release_remote}/{release_branch}...", "INFO")
+        run(["git", "reset", "--hard", f"{release_remote}/{release_branch}"])
+
+    log("RESET finished.", "INFO")
+
+
+# ==============================================================================
+# BATCH MODE
+# --batch runs one "sync.py --project DIR" process per project in a bounded
+# pool. Every child reads its own config_sync.ini and writes its own logs;
+# the parent only collects exit codes, timings and the last status line.
+# ==============================================================================
+BATCH_COMMANDS = ("dev", "zip", "update")
+
+
+def set_project_dir(path):
+    """Point the tool at another project folder (--project DIR)."""
+    global SCRIPT_DIR, CONFIG_FILE
+    SCRIPT_DIR  = os.path.abspath(path)
+    CONFIG_FILE = os.path.join(SCRIPT_DIR, "config_sync.ini")
+    DEFAULT_CONFIG["SETTINGS"]["LocalFolderName"]   = os.path.basename(SCRIPT_DIR)
+    DEFAULT_CONFIG["SETTINGS"]["RemoteProjectName"] = os.path.basename(SCRIPT_DIR)
+    # Relative config paths (ManifestPath, ReadmePath, ...) resolve from here
+    os.chdir(SCRIPT_DIR)
+
+
+def batch_status_line(output, failed):
+    """Last meaningful console line of a child run (last ERROR if it failed)."""
+    lines = [l for l in output.splitlines() if l.strip() and not l.startswith("=")]
+    lines = [l for l in lines if "[DEBUG]" not in l] or lines
+    if failed:
+        errors = [l for l in lines if "[ERROR]" in l and l.split("[ERROR]", 1)[1].strip("= ")]
+        lines  = errors or lines
+    if not lines:
+        return ""
+    return re.sub(r"^\[[0-9:]+\] \[[A-Z]+\] ", "", lines[-1]).strip()
+
+
+def run_batch_project(project, command_args):
+    """Run sync.py for one project. Returns (project, rc, seconds, status line)."""
+    entry = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sync.py")
+    cmd   = [sys.executable, entry, "--project", project, *command_args]
+    start = time.perf_counter()
+    try:
+        res = subprocess.run(cmd, text=True, encoding="utf-8", errors="replace",
+                             capture_output=True, stdin=subprocess.DEVNULL, cwd=project)
+        rc, output = res.returncode, res.stdout + res.stderr
+    except OSError as e:
+        rc, output = 127, str(e)
+    return project, rc, time.perf_counter() - start, batch_status_line(output, rc != 0)
+
+
+def cmd_batch(cfg, args, command):
+    """Run dev sync / --zip / --update in every --batch project, BatchWorkers at a time."""
+    from concurrent.futures import ThreadPoolExecutor
+    projects = []
+    names    = {}    # abspath -> path as given, shown in the summary
+    for p in args.batch:
+        path = os.path.abspath(p)
+        if not os.path.isdir(path):
+            log(f"Not a directory: {path}", "ERROR")
+            sys.exit(1)
+        if path not in projects:
+            projects.append(path)
+            names[path] = p
+
+    try:
+        workers = max(1, int(cfgget(cfg, "BatchWorkers", "4")))
+    except ValueError:
+        workers = 4
+    command_args = {"dev": [], "zip": ["--zip"], "update": ["--update"]}[command] + ["-y"]
+    if args.force:
+        command_args.append("--force")
+    if args.profile:
+        command_args.append("--profile")
+    if args.cprofile:
+        command_args.append("--cprofile")
+
+    label = "dev sync" if command == "dev" else f"--{command}"
+    log(f"Batch {label}: {len(projects)} projects, {min(workers, len(projects))} at a time.", "INFO")
+
+    start   = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(min(workers, len(projects))) as pool:
+        futures = [pool.submit(run_batch_project, p, command_args) for p in projects]
+        for future in futures:
+            project, rc, seconds, status = future.result()
+            results.append((project, rc, seconds, status))
+            log(f"  {'OK  ' if rc == 0 else 'FAIL'} {names[project]} ({seconds:.2f} s)", "DEBUG")
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if r[1] != 0]
+    width  = max(len(names[p]) for p in projects)
+    log("=" * 70, "INFO")
+    log(f"BATCH SUMMARY: {label}, {len(projects)} projects, {elapsed:.2f} s wall, "
+        f"{sum(r[2] for r in results):.2f} s total", "INFO")
+    log("-" * 70, "INFO")
+    for project, rc, seconds, status in sorted(results, key=lambda r: -r[2]):
+        state = "OK  " if rc == 0 else f"FAIL rc={rc}"
+        log(f"  {state:<11} {seconds:>7.2f} s  {names[project]:<{width}}  {status}", "INFO")
+    log("-" * 70, "INFO")
+    log(f"{len(results) - len(failed)} succeeded, {len(failed)} failed. "
+        f"Per-project logs are in each project's LogDir.", "INFO")
+    log("=" * 70, "INFO")
+    if failed:
+        sys.exit(1)
+
+
+# ==============================================================================
+# MAIN
+# ==============================================================================
+def main():
+    global CURRENT_LOG_FILE
+
+    parser = argparse.ArgumentParser(
+        description="MAMBA SYNC TOOL - maintains clean public master, preserves full dev history",
+        formatter_class=argparse.RawTextHelpFormatter,
+        fromfile_prefix_chars="@",
+    )
+    parser.add_argument("--zip",         action="store_true",
+                        help="Create local whitelist ZIP")
+    parser.add_argument("--full-backup", action="store_true",
+                        help="Full backup (.git included)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="With --full-backup: base + delta archives keyed on content hashes")
+    parser.add_argument("--restore-backup", metavar="DEST",
+                        help="Rebuild an incremental backup point into DEST (empty dir)")
+    parser.add_argument("--at",          metavar="POINT",
+                        help="With --restore-backup: point index or archive name (default: latest)")
+    parser.add_argument("--update",      action="store_true",
+                        help="Update master (+1 commit, whitelisted files, ZERO dev history leak)")
+    parser.add_argument("--release",     action="store_true",
+                        help="--update + ZIPs + GitHub Release")
+    parser.add_argument("--deploy",      action="store_true",
+                        help="WIPE master history (orphan commit, use for cleanup)")
+    parser.add_argument("--force",       action="store_true",
+                        help="With --update/--release: commit even if master already matches dev")
+    parser.add_argument("--reset",       action="store_true",
+                        help="Force pull master from GitHub")
+    parser.add_argument("--gc-safety",   action="store_true",
+                        help="Prune/pack expired sync-safety-* branches and report reclaimed space")
+    parser.add_argument("--log-summary", action="store_true",
+                        help="Per-phase timing table from the JSON run journals in LogDir")
+    parser.add_argument("--profile",     action="store_true",
+                        help="Count processes/time per git subcommand and phase I/O; report at exit")
+    parser.add_argument("--cprofile",    action="store_true",
+                        help="--profile + cProfile hot spots of the Python side")
+    parser.add_argument("--project",     metavar="DIR",
+                        help="Run against project DIR (its config_sync.ini) instead of the script folder")
+    parser.add_argument("--batch",       nargs="+", metavar="DIR",
+                        help="Dev sync / --zip / --update in many projects in parallel\n"
+                             "(@file reads one DIR per line)")
+    parser.add_argument("-y", "--yes",   action="store_true",
+                        help="Skip all prompts")
+    args = parser.parse_args()
+
+    if args.project:
+        if not os.path.isdir(args.project):
+            print(f"Project folder not found: {args.project}")
+            sys.exit(1)
+        set_project_dir(args.project)
+
+    if args.batch:
+        command = "zip" if args.zip else "update" if args.update else "dev"
+        others  = [args.full_backup, args.incremental, args.restore_backup, args.at, args.release,
+                   args.deploy, args.reset, args.gc_safety, args.log_summary, args.project]
+        if args.zip and args.update:
+            log("--batch runs one command per call: --zip and --update cannot be combined.", "ERROR")
+            sys.exit(1)
+        if any(others):
+            log(f"--batch supports only: {', '.join(BATCH_COMMANDS)} (dev = no command flag)", "ERROR")
+            sys.exit(1)
+        # The batch runner needs no project of its own; read its config if present, never write it
+        cfg = load_and_sync_config(write=False) if os.path.exists(CONFIG_FILE) else DEFAULT_CONFIG["SETTINGS"]
+        LOG.configure(cfg)
+        cmd_batch(cfg, args, command)
+        return
+
+    # Plain dev sync (editor save hooks): cached read-only config + version,
+    # log file created only if there is something to commit
+    fast = not any([args.restore_backup, args.full_backup, args.zip, args.update, args.release,
+                    args.deploy, args.reset, args.gc_safety, args.log_summary,
+                    args.profile, args.cprofile])
+    startup = StartupCache() if fast else None
+
+    cfg = load_config_cached(startup) if fast else load_and_sync_config()
+    LOG.configure(cfg)
+    use_fsmonitor(cfg)
+
+    print("\n====================================================")
+    print(f"  MAMBA SYNC TOOL v{SCRIPT_VER} | {cfgget(cfg, 'RemoteProjectName', 'PROJECT')}")
+    print("====================================================\n")
+
+    # Determine command string
+    if args.restore_backup:
+        cmd_str = "--restore-backup"
+        cmd_filename = "sync--restore-backup"
+    elif args.full_backup:
+        cmd_str = "--full-backup"
+        cmd_filename = "sync--full-backup"
+    elif args.zip:
+        cmd_str = "--zip"
+        cmd_filename = "sync--zip"
+    elif args.update:
+        cmd_str = "--update"
+        cmd_filename = "sync--update"
+    elif args.release:
+        cmd_str = "--release"
+        cmd_filename = "sync--release"
+    elif args.deploy:
+        cmd_str = "--deploy"
+        cmd_filename = "sync--deploy"
+    elif args.reset:
+        cmd_str = "--reset"
+        cmd_filename = "sync--reset"
+    elif args.gc_safety:
+        cmd_str = "--gc-safety"
+        cmd_filename = "sync--gc-safety"
+    elif args.log_summary:
+        cmd_str = "--log-summary"
+        cmd_filename = "sync--log-summary"
+    else:
+        cmd_str = "(default dev sync)"
+        cmd_filename = "sync--dev"
+
+    # Setup logging with header
+    log_dir  = cfgget(cfg, "LogDir", "logs")
+    json_log = cfgget(cfg, "EnableJsonLog", "false").lower() == "true"
+    CURRENT_LOG_FILE = os.path.join(
+        SCRIPT_DIR, log_dir,
+        f"{datetime.now().strftime('%Y-%m-%d_%H%M%S')}_{cmd_filename}.log"
+    )
+    
+    write_log_header(cmd_str, CURRENT_LOG_FILE, deferred=fast and not json_log)
+    log(f"Log file: {CURRENT_LOG_FILE}", "DEBUG")
+    if json_log:
+        JOURNAL.open(os.path.splitext(CURRENT_LOG_FILE)[0] + ".jsonl", cmd_str)
+        log(f"Run journal: {JOURNAL.path}", "DEBUG")
+
+    if args.profile or args.cprofile:
+        PROFILE.start(cmd_str, cpu=args.cprofile)
+
+    try:
+        with JOURNAL.span("run", command=cmd_str):
+            with JOURNAL.span("version"):
+                if fast:
+                    version = resolve_version_cached(cfg, startup)
+                    startup.save()
+                else:
+                    version = resolve_version(cfg)
+            log(f"Project version: {version}", "DEBUG")
+
+            # Dispatch
+            if args.restore_backup:
+                cmd_restore_backup(cfg, args)
+            elif args.full_backup and args.incremental:
+                cmd_incremental_backup(cfg, version)
+            elif args.full_backup:
+                cmd_full_backup(cfg, version)
+            elif args.zip:
+                cmd_zip(cfg, version)
+            elif args.update:
+                cmd_update(cfg, version, args)
+            elif args.release:
+                cmd_release(cfg, version, args)
+            elif args.deploy:
+                cmd_deploy(cfg, version, args)
+            elif args.reset:
+                cmd_reset(cfg, args)
+            elif args.gc_safety:
+                cmd_gc_safety(cfg)
+            elif args.log_summary:
+                cmd_log_summary(cfg)
+            else:
+                cmd_dev_sync(cfg, version, args)
+    finally:
+        if PROFILE.enabled:
+            PROFILE.report(os.path.splitext(CURRENT_LOG_FILE)[0])
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,525 @@
+# ==============================================================================
+# MAMBA SYNC TOOL - regression tests
+#
+# python -m unittest test_sync
+# ==============================================================================
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import sync_core as sync
+
+
+def git(cwd, *args):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@unittest.skipIf(sys.platform in ("win32", "darwin"),
+                 "filesystem does not accept non UTF-8 file names")
+class RepoStatusNonUtf8Test(unittest.TestCase):
+    """git status -z reports raw bytes; a non UTF-8 untracked name must not crash the scan."""
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp(prefix="sync-test-")
+        git(self.repo, "init", "-q", "-b", "dev")
+        git(self.repo, "config", "user.email", "test@example.com")
+        git(self.repo, "config", "user.name", "test")
+        with open(os.path.join(self.repo, "README.md"), "w") as f:
+            f.write("# P\n")
+        git(self.repo, "add", "README.md")
+        git(self.repo, "commit", "-q", "-m", "initial")
+        with open(os.path.join(os.fsencode(self.repo), b"bad\xe9name.cs"), "w") as f:
+            f.write("x\n")
+        self.script_dir = sync.SCRIPT_DIR
+        sync.SCRIPT_DIR = self.repo
+        sync.STATUS.invalidate()
+
+    def tearDown(self):
+        sync.SCRIPT_DIR = self.script_dir
+        sync.STATUS.invalidate()
+        shutil.rmtree(self.repo, ignore_errors=True)
+
+    def test_scan_untracked_non_utf8(self):
+        status = sync.STATUS.get()
+        self.assertEqual(status["head"], "dev")
+        self.assertIn(("??", "bad\udce9name.cs"), status["entries"])
+        self.assertTrue(sync.STATUS.dirty)
+
+    def test_display_path(self):
+        self.assertEqual(sync.display_path("bad\udce9name.cs"), "bad�name.cs")
+
+
+
+@unittest.skipIf(sys.platform in ("win32", "darwin"),
+                 "filesystem does not accept non UTF-8 file names")
+class NonUtf8TreeTest(unittest.TestCase):
+    """ls-tree / diff-tree -z output and ZIP names with raw path bytes."""
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp(prefix="sync-test-")
+        git(self.repo, "init", "-q", "-b", "dev")
+        git(self.repo, "config", "user.email", "test@example.com")
+        git(self.repo, "config", "user.name", "test")
+        os.makedirs(os.path.join(self.repo, "src"))
+        for name in (b"src/bad\xe9name.cs", b"src/ lead and trail ", b"src/ok.cs"):
+            with open(os.path.join(os.fsencode(self.repo), name), "w") as f:
+                f.write("x\n")
+        git(self.repo, "add", "-A")
+        git(self.repo, "commit", "-q", "-m", "initial")
+        self.script_dir = sync.SCRIPT_DIR
+        sync.SCRIPT_DIR = self.repo
+        sync.GIT.invalidate()
+
+    def tearDown(self):
+        sync.SCRIPT_DIR = self.script_dir
+        sync.GIT.invalidate()
+        sync.STATUS.invalidate()
+        shutil.rmtree(self.repo, ignore_errors=True)
+
+    def test_filtered_tree_entries(self):
+        entries = sync.filtered_tree_entries("HEAD", ["src/"])
+        paths   = sorted(e[4] for e in entries)
+        self.assertEqual(paths, ["src/ lead and trail ", "src/bad\udce9name.cs", "src/ok.cs"])
+
+    def test_transition_worktree(self):
+        git(self.repo, "rm", "-q", os.fsdecode(b"src/bad\xe9name.cs"))
+        git(self.repo, "commit", "-q", "-m", "remove")
+        touched, _, _ = sync.transition_worktree("HEAD", "HEAD~1^{tree}")
+        self.assertEqual(touched, 1)
+
+    def test_zip_round_trip(self):
+        import zipfile
+        out = os.path.join(self.repo, "out.zip")
+        sync.create_zip(os.path.join(self.repo, "src"), out)
+        with zipfile.ZipFile(out) as z:
+            self.assertIsNone(z.testzip())
+            names = sorted(sync.zip_member_path(info) for info in z.infolist())
+        self.assertEqual(names, [" lead and trail ", "bad\udce9name.cs", "ok.cs"])
+
+
+
+class WhitelistMatcherTest(unittest.TestCase):
+    """ReleaseWhiteList globs, ! exclusions, anchoring and folder pruning."""
+
+    # (whitelist, path, expected matches())
+    MATCHES = [
+        (["README.md"],                       "README.md",           True),
+        (["README.md"],                       "docs/README.md",      False),   # anchored at root
+        (["README.md"],                       "README.mdx",          False),
+        (["Plugin/"],                         "Plugin/a.cs",         True),
+        (["Plugin/"],                         "Plugin/x/y.cs",       True),
+        (["Plugin/"],                         "PluginX/a.cs",        False),
+        (["Plugin/"],                         "src/Plugin/a.cs",     False),
+        (["docs/*.md"],                       "docs/a.md",           True),
+        (["docs/*.md"],                       "docs/.md",            True),
+        (["docs/*.md"],                       "docs/sub/a.md",       False),   # * stays in one folder
+        (["docs/*.md"],                       "xdocs/a.md",          False),
+        (["**/*.xml"],                        "a.xml",               True),
+        (["**/*.xml"],                        "x/y/a.xml",           True),
+        (["**/*.xml"],                        "a.xmlx",              False),
+        (["Plugin/**/*.xml"],                 "Plugin/a.xml",        True),    # **/ matches zero folders
+        (["Plugin/**/*.xml"],                 "Plugin/x/y/a.xml",    True),
+        (["Plugin/**/*.xml"],                 "Other/a.xml",         False),
+        (["src/**"],                          "src/x/y",             True),
+        (["file?.txt"],                       "file1.txt",           True),
+        (["file?.txt"],                       "file12.txt",          False),
+        (["file?.txt"],                       "file/.txt",           False),   # ? never matches /
+        (["v[0-9].txt"],                      "v1.txt",              True),
+        (["v[0-9].txt"],                      "va.txt",              False),
+        (["v[!0-9].txt"],                     "va.txt",              True),
+        (["v[!0-9].txt"],                     "v1.txt",              False),
+        (["a[b"],                             "a[b",                 True),    # unclosed [ is literal
+        (["a+b(c).txt"],                      "a+b(c).txt",          True),
+        (["a+b(c).txt"],                      "aab(c).txt",          False),
+        (["Plugin/", "!Plugin/**/*.pdb"],     "Plugin/a.pdb",        False),
+        (["Plugin/", "!Plugin/**/*.pdb"],     "Plugin/x/a.pdb",      False),
+        (["Plugin/", "!Plugin/**/*.pdb"],     "Plugin/a.dll",        True),
+        (["*.md", "!README.md"],              "README.md",           False),
+        (["*.md", "!README.md"],              "CHANGELOG.md",        True),
+        (["!README.md", "README.md"],         "README.md",           False),   # exclusions always win
+        (["Plugin/", "!Plugin/tmp/"],         "Plugin/tmp/a",        False),
+        (["Plugin/", "!Plugin/tmp/"],         "Plugin/tmpx/a",       True),
+        ([],                                  "README.md",           False),
+    ]
+
+    # (whitelist, folder, expected may_contain())
+    MAY_CONTAIN = [
+        (["Plugin/", "README.md"],            "Plugin",              True),
+        (["Plugin/", "README.md"],            "Plugin/x",            True),
+        (["Plugin/", "README.md"],            "node_modules",        False),
+        (["docs/*.md"],                       "docs",                True),
+        (["docs/*.md"],                       "docs/sub",            False),
+        (["a/b/c.txt"],                       "a",                   True),
+        (["a/b/c.txt"],                       "a/b",                 True),
+        (["a/b/c.txt"],                       "a/b/x",               False),
+        (["a/b/c.txt"],                       "b",                   False),
+        (["Plugin/**/*.xml"],                 "Plugin/x/y",          True),
+        (["Plugin/**/*.xml"],                 "Other",               False),
+        (["**/*.xml"],                        "x/y",                 True),
+        (["*.md"],                            "docs",                False),
+        (["Plugin/", "!Plugin/tmp/"],         "Plugin/tmp",          False),
+        (["Plugin/", "!Plugin/tmp/"],         "Plugin/tmpx",         True),
+        (["Plugin/", "!Plugin/**/*.pdb"],     "Plugin/x",            True),
+    ]
+
+    def test_matches(self):
+        for whitelist, path, expected in self.MATCHES:
+            with self.subTest(whitelist=whitelist, path=path):
+                self.assertIs(sync.WhitelistMatcher(whitelist).matches(path), expected)
+
+    def test_may_contain(self):
+        for whitelist, folder, expected in self.MAY_CONTAIN:
+            with self.subTest(whitelist=whitelist, folder=folder):
+                self.assertIs(sync.WhitelistMatcher(whitelist).may_contain(folder), expected)
+
+    def test_pruning_never_hides_a_match(self):
+        for whitelist, path, expected in self.MATCHES:
+            if not expected or "/" not in path:
+                continue
+            matcher = sync.WhitelistMatcher(whitelist)
+            parts   = path.split("/")[:-1]
+            for i in range(1, len(parts) + 1):
+                with self.subTest(whitelist=whitelist, folder="/".join(parts[:i])):
+                    self.assertTrue(matcher.may_contain("/".join(parts[:i])))
+
+    def test_pathspecs(self):
+        matcher = sync.WhitelistMatcher(["Plugin/", "README.md", "docs/*.md", "!Plugin/tmp/"])
+        self.assertEqual(matcher.pathspecs(), ["Plugin/", "README.md", "docs/"])
+        self.assertEqual(sync.WhitelistMatcher(["**/*.xml"]).pathspecs(), [])
+
+    def test_compiled_once(self):
+        self.assertIs(sync.compile_whitelist(["a/", "b"]), sync.compile_whitelist(["a/", "b"]))
+
+
+
+class ZipWriterTest(unittest.TestCase):
+    """create_zip / ParallelZipWriter output read back with zipfile."""
+
+    FILES = {
+        "a.txt":          b"compress me\n" * 2000,
+        "empty.txt":      b"",
+        "img/pic.png":    b"\x89PNG" + bytes(range(256)) * 8,
+        "deep/x/y/z.bin": bytes(range(256)) * 40,
+        "random.dat":     os.urandom(4096),
+    }
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="sync-test-")
+        self.src = os.path.join(self.dir, "src")
+        for name, data in self.FILES.items():
+            path = os.path.join(self.src, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def read_back(self, path):
+        import zipfile
+        with zipfile.ZipFile(path) as z:
+            self.assertIsNone(z.testzip())
+            return {i.filename: (i.compress_type, z.read(i)) for i in z.infolist()}
+
+    def test_methods_and_workers(self):
+        for method in sync.ZIP_METHODS:
+            for workers in (1, 4):
+                with self.subTest(method=method, workers=workers):
+                    out    = os.path.join(self.dir, f"{method}-{workers}.zip")
+                    policy = sync.ZipPolicy(method, 6, [".png"])
+                    sync.create_zip(self.src, out, workers=workers, policy=policy)
+                    members = self.read_back(out)
+                    self.assertEqual({n: d for n, (_, d) in members.items()}, self.FILES)
+                    self.assertEqual(members["a.txt"][0], sync.ZIP_METHODS[method])
+                    self.assertEqual(members["img/pic.png"][0], sync.ZIP_STORED)
+                    self.assertEqual(members["random.dat"][0], sync.ZIP_STORED)   # no gain
+                    self.assertEqual(members["empty.txt"][1], b"")
+
+    def test_deterministic_identical(self):
+        outputs = []
+        for workers in (1, 4):
+            for name in self.FILES:
+                os.utime(os.path.join(self.src, name), (1e9 + workers, 1e9 + workers))
+            out = os.path.join(self.dir, f"det-{workers}.zip")
+            sync.create_zip(self.src, out, workers=workers, deterministic=True)
+            with open(out, "rb") as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_empty_archive(self):
+        out = os.path.join(self.dir, "empty.zip")
+        with sync.ParallelZipWriter(out, workers=2):
+            pass
+        self.assertEqual(self.read_back(out), {})
+        self.assertEqual(sorted(os.listdir(self.dir)), ["empty.zip", "src"])   # temp file renamed
+
+    def test_zip64_past_small_limits(self):
+        from unittest import mock
+        out = os.path.join(self.dir, "zip64.zip")
+        with mock.patch.object(sync, "ZIP_MAX_32", 1000), mock.patch.object(sync, "ZIP_MAX_16", 3):
+            sync.create_zip(self.src, out, workers=2, policy=sync.ZipPolicy("deflate"))
+        with open(out, "rb") as f:
+            data = f.read()
+        self.assertIn(b"PK\x06\x06", data)                      # ZIP64 end of central directory
+        self.assertIn(b"PK\x06\x07", data)                      # ZIP64 locator
+        members = self.read_back(out)
+        self.assertEqual({n: d for n, (_, d) in members.items()}, self.FILES)
+
+
+
+@unittest.skipIf(sys.platform == "win32", "stub gh is a shell script")
+class RemoteRefsOfflineTest(unittest.TestCase):
+    """Remote ref cache against a local bare remote; GitHub CLI stubbed on PATH."""
+
+    def setUp(self):
+        self.root   = tempfile.mkdtemp(prefix="sync-test-")
+        self.proj   = os.path.join(self.root, "proj")
+        self.remote = os.path.join(self.root, "remote.git")
+        self.trace  = os.path.join(self.root, "git-trace.log")
+        self.gh_log = os.path.join(self.root, "gh.log")
+
+        bin_dir = os.path.join(self.root, "bin")
+        os.makedirs(bin_dir)
+        with open(os.path.join(bin_dir, "gh"), "w") as f:
+            f.write(f'#!/bin/sh\necho "$*" >> "{self.gh_log}"\nexit 0\n')
+        os.chmod(os.path.join(bin_dir, "gh"), 0o755)
+        self.env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ["PATH"])
+
+        git(self.root, "init", "-q", "--bare", self.remote)
+        os.makedirs(os.path.join(self.proj, "Plugin"))
+        files = {
+            ".gitignore":   "logs/\n*.zip\nconfig_sync.ini\nsync.py\nsync_core.py\n",
+            "README.md":    "# P\nVersion: 0.0.1\n",
+            "CHANGELOG.md": "# Changelog\n",
+            "manifest.xml": "<Plugin><Version>1.2.3</Version></Plugin>\n",
+            "Plugin/a.cs":  "a\n",
+            "tools.py":     "private\n",
+        }
+        for name, text in files.items():
+            with open(os.path.join(self.proj, name), "w") as f:
+                f.write(text)
+        git(self.proj, "init", "-q", "-b", "dev")
+        git(self.proj, "config", "user.email", "test@example.com")
+        git(self.proj, "config", "user.name", "test")
+        git(self.proj, "add", "-A")
+        git(self.proj, "commit", "-q", "-m", "feat: initial")
+        git(self.proj, "remote", "add", "origin", self.remote)
+        git(self.proj, "push", "-q", "origin", "dev")
+        git(self.proj, "checkout", "-q", "--orphan", "master")
+        git(self.proj, "rm", "-rfq", "--cached", ".")
+        git(self.proj, "commit", "-q", "--allow-empty", "-m", "init")
+        git(self.proj, "push", "-q", "origin", "master")
+        git(self.proj, "checkout", "-q", "-f", "dev")
+
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in ("sync.py", "sync_core.py"):
+            shutil.copy2(os.path.join(here, name), self.proj)
+        self.sync()                                        # writes the default config
+
+        self.script_dir = sync.SCRIPT_DIR
+        self.remote_refs = sync.REMOTE_REFS
+
+    def tearDown(self):
+        sync.SCRIPT_DIR  = self.script_dir
+        sync.REMOTE_REFS = self.remote_refs
+        sync.GIT.close()
+        sync.GIT.invalidate()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def sync(self, *args, trace=False):
+        env = dict(self.env, GIT_TRACE=self.trace) if trace else self.env
+        res = subprocess.run([sys.executable, "sync.py", *args, "-y"], cwd=self.proj, env=env,
+                             capture_output=True, text=True, stdin=subprocess.DEVNULL)
+        self.assertEqual(res.returncode, 0, res.stdout + res.stderr)
+        return res
+
+    def git_calls(self, subcommand):
+        if not os.path.exists(self.trace):
+            return 0
+        with open(self.trace) as f:
+            return sum(f"built-in: git {subcommand} " in line for line in f)
+
+    def remote_tree(self, ref):
+        res = subprocess.run(["git", "ls-tree", "-r", "--name-only", ref], cwd=self.remote,
+                             check=True, capture_output=True, text=True)
+        return sorted(res.stdout.splitlines())
+
+    def test_update_lists_remote_once(self):
+        self.sync("--update", trace=True)
+        self.assertEqual(self.git_calls("ls-remote"), 1)
+        self.assertEqual(self.remote_tree("master"),
+                         [".gitignore", "CHANGELOG.md", "Plugin/a.cs", "README.md", "manifest.xml"])
+
+    def test_release_with_stub_gh(self):
+        self.sync("--release", trace=True)
+        self.assertEqual(self.git_calls("ls-remote"), 1)
+        with open(self.gh_log) as f:
+            calls = f.read().splitlines()
+        self.assertIn("release create v1.2.3 --draft --title Release v1.2.3 --notes Release v1.2.3", calls)
+        self.assertTrue(any(c.startswith("release upload v1.2.3 ") and "SOURCE" in c for c in calls))
+        self.assertEqual(calls[-1], "release edit v1.2.3 --draft=false")
+        self.assertIn("Plugin/a.cs", self.remote_tree("master"))
+
+    def test_cache_answers_later_checks(self):
+        sync.SCRIPT_DIR  = self.proj
+        sync.REMOTE_REFS = refs = sync.RemoteRefs()
+        calls = []
+        real  = sync.exec_cmd
+
+        def counting(cmd, *args, **kwargs):
+            calls.append(cmd[:2])
+            return real(cmd, *args, **kwargs)
+
+        from unittest import mock
+        with mock.patch.object(sync, "exec_cmd", counting):
+            self.assertTrue(sync.branch_exists_remote("origin", "master"))
+            self.assertTrue(sync.branch_exists_remote("origin", "dev"))
+            self.assertFalse(sync.branch_exists_remote("origin", "missing"))
+        self.assertEqual(calls, [["git", "ls-remote"]])
+
+        git(self.proj, "commit", "-q", "--allow-empty", "-m", "local")
+        git(self.proj, "push", "-q", "origin", "dev")
+        refs.pushed("origin", "dev")
+        res = subprocess.run(["git", "rev-parse", "dev"], cwd=self.proj,
+                             check=True, capture_output=True, text=True)
+        self.assertEqual(refs.head("origin", "dev"), res.stdout.strip())
+
+    def test_pushed_without_listing_starts_nothing(self):
+        sync.SCRIPT_DIR = self.proj
+        sync.GIT.close()
+        refs = sync.RemoteRefs()
+        refs.pushed("origin", "dev")
+        self.assertIsNone(sync.GIT.proc)
+        self.assertEqual(refs.heads, {})
+
+    def test_unreachable_remote_aborts(self):
+        sync.SCRIPT_DIR = self.proj
+        git(self.proj, "remote", "add", "gone", os.path.join(self.root, "missing.git"))
+        with self.assertRaises(SystemExit):
+            sync.RemoteRefs().head("gone", "master")
+
+
+
+class SafetySnapshotTest(unittest.TestCase):
+    """create/restore_safety_snapshot bring back the exact dirty state."""
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp(prefix="sync-test-")
+        git(self.repo, "init", "-q", "-b", "dev")
+        git(self.repo, "config", "user.email", "test@example.com")
+        git(self.repo, "config", "user.name", "test")
+        for name in ("a.txt", "b.txt", "c.txt", "sub/d.txt", "sub/e.txt"):
+            self.write(name, "base\n")
+        git(self.repo, "add", "-A")
+        git(self.repo, "commit", "-q", "-m", "initial")
+        self.script_dir = sync.SCRIPT_DIR
+        sync.SCRIPT_DIR = self.repo
+        sync.GIT.invalidate()
+        sync.STATUS.invalidate()
+
+    def tearDown(self):
+        sync.SCRIPT_DIR = self.script_dir
+        sync.GIT.invalidate()
+        sync.STATUS.invalidate()
+        shutil.rmtree(self.repo, ignore_errors=True)
+
+    def write(self, name, text):
+        path = os.path.join(self.repo, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def status(self):
+        res = subprocess.run(["git", "status", "--porcelain", "--untracked-files=all"],
+                             cwd=self.repo, check=True, capture_output=True, text=True)
+        return sorted(res.stdout.splitlines())
+
+    def test_restore_deletions_and_untracked(self):
+        self.write("a.txt", "staged\n")
+        git(self.repo, "add", "a.txt")
+        self.write("a.txt", "staged + worktree\n")           # MM a.txt
+        self.write("b.txt", "worktree\n")                    #  M b.txt
+        os.remove(os.path.join(self.repo, "c.txt"))          #  D c.txt
+        git(self.repo, "rm", "-q", "sub/d.txt", "sub/e.txt")  # D  sub/d.txt, sub/e.txt
+        self.write("u.txt", "untracked\n")                   # ?? u.txt
+        before = self.status()
+
+        head     = sync.get_current_commit()
+        snapshot = sync.create_safety_snapshot(head)
+        self.assertEqual(self.status(), before)              # capture touches nothing
+
+        git(self.repo, "reset", "-q", "--hard")
+        git(self.repo, "clean", "-q", "-fd")
+        sync.restore_safety_snapshot(snapshot)
+
+        self.assertEqual(self.status(), before)
+        self.assertFalse(os.path.exists(os.path.join(self.repo, "sub")))
+        with open(os.path.join(self.repo, "a.txt")) as f:
+            self.assertEqual(f.read(), "staged + worktree\n")
+        res = subprocess.run(["git", "show", ":a.txt"], cwd=self.repo,
+                             check=True, capture_output=True, text=True)
+        self.assertEqual(res.stdout, "staged\n")
+
+
+
+class ChangelogSectionTest(unittest.TestCase):
+    """insert_changelog_section: new section on top, merge into the newest one."""
+
+    OLD = ("## [1.0.0] - 2020-01-01\n\n### Fixes\n- old fix\n\n"
+           "## [0.9.0] - 2019-01-01\n\n### Features\n- first\n\n")
+
+    def setUp(self):
+        self.dir  = tempfile.mkdtemp(prefix="sync-test-")
+        self.path = os.path.join(self.dir, "CHANGELOG.md")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write(self, data):
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def test_new_section_on_top(self):
+        self.write(b"# Changelog\n" + self.OLD.encode())
+        self.assertTrue(sync.insert_changelog_section(self.path, "1.1.0", {"Features": ["- new"]}))
+        data = self.read()
+        self.assertTrue(data.startswith(b"# Changelog\n\n## [1.1.0] - "))
+        self.assertIn(b"### Features\n- new\n\n## [1.0.0]", data)
+        self.assertTrue(data.endswith(self.OLD.encode()))   # older sections byte-identical
+
+    def test_new_section_new_file(self):
+        sync.insert_changelog_section(self.path, "1.0.0", {"Fixes": ["- a"]})
+        self.assertTrue(self.read().startswith(b"## [1.0.0] - "))
+
+    def test_merge_keeps_date_and_rest(self):
+        self.write(b"# Changelog\n\n" + self.OLD.encode())
+        self.assertTrue(sync.insert_changelog_section(
+            self.path, "1.0.0", {"Fixes": ["- old fix", "- new fix"], "Features": ["- feat"]}))
+        data = self.read()
+        self.assertTrue(data.startswith(b"# Changelog\n\n## [1.0.0] - 2020-01-01\n\n"
+                                        b"### Features\n- feat\n\n### Fixes\n- old fix\n- new fix\n\n"))
+        self.assertEqual(data.count(b"- old fix"), 1)
+        self.assertTrue(data.endswith(b"## [0.9.0] - 2019-01-01\n\n### Features\n- first\n\n"))
+
+    def test_merge_nothing_new(self):
+        self.write(b"# Changelog\n\n" + self.OLD.encode())
+        before = os.stat(self.path).st_mtime_ns
+        self.assertFalse(sync.insert_changelog_section(self.path, "1.0.0", {"Fixes": ["- old fix"]}))
+        self.assertEqual(os.stat(self.path).st_mtime_ns, before)
+
+    def test_crlf_kept(self):
+        self.write(b"# C\r\n\r\n## [0.9] - 2019-01-01\r\n\r\n### Fixes\r\n- z\r\n\r\n")
+        sync.insert_changelog_section(self.path, "0.9", {"Fixes": ["- z", "- y"]})
+        self.assertEqual(self.read(), b"# C\r\n\r\n## [0.9] - 2019-01-01\r\n\r\n"
+                                      b"### Fixes\r\n- z\r\n- y\r\n\r\n")
+
+
+if __name__ == "__main__":
+    unittest.main()